@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class OrderConfig(AppConfig):
     name = 'order'
+
+    def ready(self):
+        import order.book
@@ -0,0 +1,268 @@
+import heapq
+import threading
+from datetime import datetime
+from decimal  import Decimal
+
+from django.conf      import settings
+from django.db        import connection, transaction
+from django.db.models import signals
+from django.dispatch  import receiver
+
+from order.models     import Ask, Bid, order_status_id
+
+ORDER_STATUS_CURRENT = 'current'
+
+class BookSide:
+    def __init__(self, sign):
+        self.sign   = sign
+        self.heap   = []
+        self.prices = {}
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __contains__(self, order_id):
+        return order_id in self.prices
+
+    def add(self, order_id, price):
+        if self.prices.get(order_id) == price:
+            return
+
+        self.prices[order_id] = price
+        heapq.heappush(self.heap, (self.sign * price, order_id))
+
+    def discard(self, order_id):
+        self.prices.pop(order_id, None)
+
+    def best(self):
+        while self.heap:
+            signed_price, order_id = self.heap[0]
+
+            if self.prices.get(order_id) == self.sign * signed_price:
+                return order_id, self.prices[order_id]
+
+            heapq.heappop(self.heap)
+
+        return None
+
+    def pop(self):
+        best = self.best()
+
+        if best:
+            heapq.heappop(self.heap)
+            del self.prices[best[0]]
+
+        return best
+
+    def snapshot(self):
+        return dict(self.prices)
+
+class OrderBook:
+    def __init__(self):
+        self.asks = BookSide(1)
+        self.bids = BookSide(-1)
+
+class OrderBookRegistry:
+    def __init__(self):
+        self.books = {}
+        self.lock  = threading.RLock()
+
+    def clear(self):
+        with self.lock:
+            self.books = {}
+
+    def load(self, product_size_ids=None):
+        books = {product_size_id: OrderBook() for product_size_id in product_size_ids or []}
+
+        for model, side in [(Ask, 'asks'), (Bid, 'bids')]:
+            orders = model.objects.filter(order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+
+            if product_size_ids is not None:
+                orders = orders.filter(product_size_id__in=product_size_ids)
+
+            for order_id, product_size_id, price in orders.values_list('id', 'product_size_id', 'price').iterator():
+                books.setdefault(product_size_id, OrderBook())
+                getattr(books[product_size_id], side).add(order_id, price)
+
+        with self.lock:
+            self.books.update(books)
+
+        return books
+
+    def get(self, product_size_id):
+        with self.lock:
+            if product_size_id not in self.books:
+                self.load([product_size_id])
+
+            return self.books[product_size_id]
+
+    def sync(self, side, product_size_id, order_id, price, current):
+        with self.lock:
+            book = self.books.get(product_size_id)
+
+            if not book:
+                return
+
+            if current:
+                getattr(book, side).add(order_id, Decimal(str(price)))
+            else:
+                getattr(book, side).discard(order_id)
+
+    def remove(self, side, product_size_id, order_ids):
+        with self.lock:
+            book = self.books.get(product_size_id)
+
+            if not book:
+                return
+
+            for order_id in order_ids:
+                getattr(book, side).discard(order_id)
+
+    def best_ask(self, product_size_id, lock=False, limit=None):
+        return self.best(Ask, 'asks', product_size_id, lock, limit)
+
+    def best_bid(self, product_size_id, lock=False, limit=None):
+        return self.best(Bid, 'bids', product_size_id, lock, limit)
+
+    def best(self, model, side, product_size_id, lock=False, limit=None):
+        with self.lock:
+            book_side = getattr(self.get(product_size_id), side)
+            skipped   = []
+
+            try:
+                while True:
+                    best = book_side.pop()
+
+                    if not best:
+                        return None
+
+                    if limit is not None and book_side.sign * best[1] > book_side.sign * limit:
+                        skipped.append(best)
+                        return None
+
+                    orders = model.objects.filter(
+                        id              = best[0],
+                        product_size_id = product_size_id,
+                        order_status_id = order_status_id(ORDER_STATUS_CURRENT)
+                    )
+                    order  = (orders.select_for_update(skip_locked=True) if lock else orders).first()
+
+                    if order and order.price != best[1]:
+                        book_side.add(order.id, order.price)
+                        continue
+
+                    if order:
+                        skipped.append(best)
+                        return order
+
+                    if lock and orders.exists():
+                        skipped.append(best)
+            finally:
+                for order_id, price in skipped:
+                    book_side.add(order_id, price)
+
+    def check(self, product_size_ids=None):
+        with self.lock:
+            product_size_ids = list(self.books) if product_size_ids is None else product_size_ids
+            expected         = OrderBookRegistry().load(product_size_ids)
+            mismatches       = []
+
+            for product_size_id in product_size_ids:
+                book = self.books.get(product_size_id)
+
+                if not book:
+                    continue
+
+                for side in ['asks', 'bids']:
+                    actual   = getattr(book, side).snapshot()
+                    database = getattr(expected.get(product_size_id, OrderBook()), side).snapshot()
+
+                    if actual != database:
+                        mismatches.append({
+                            'product_size_id' : product_size_id,
+                            'side'            : side,
+                            'missing'         : sorted(set(database) - set(actual)),
+                            'stale'           : sorted(set(actual) - set(database)),
+                            'repriced'        : sorted(order_id for order_id in set(actual) & set(database)
+                                                    if actual[order_id] != database[order_id]),
+                        })
+
+            return mismatches
+
+order_books = OrderBookRegistry()
+
+class OrderBookReconciler:
+    def __init__(self):
+        self.repaired    = 0
+        self.last_run_at = None
+        self.lock        = threading.Lock()
+        self.timer       = None
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'repaired'    : self.repaired,
+                'last_run_at' : self.last_run_at,
+            }
+
+    def reconcile(self):
+        mismatches = order_books.check()
+
+        if mismatches:
+            order_books.load(sorted({mismatch['product_size_id'] for mismatch in mismatches}))
+
+        with self.lock:
+            self.repaired    += len(mismatches)
+            self.last_run_at  = datetime.now()
+
+        return mismatches
+
+    def start(self, interval):
+        def run():
+            try:
+                self.reconcile()
+            finally:
+                connection.close()
+
+                if self.timer:
+                    self.start(interval)
+
+        self.timer        = threading.Timer(interval, run)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stop(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+order_book_reconciler = OrderBookReconciler()
+
+def order_book_enabled():
+    return getattr(settings, 'ORDER_BOOK_ENABLED', False)
+
+def sync_on_commit(side, order, deleted=False):
+    if not order_book_enabled():
+        return
+
+    current = not deleted and order.order_status_id == order_status_id(ORDER_STATUS_CURRENT)
+    values  = (side, order.product_size_id, order.id, order.price, current)
+
+    # the book only reflects committed rows; a rolled back write never reaches it
+    transaction.on_commit(lambda: order_books.sync(*values))
+
+@receiver(signals.post_save, sender=Ask)
+def sync_saved_ask(sender, instance, **kwargs):
+    sync_on_commit('asks', instance)
+
+@receiver(signals.post_save, sender=Bid)
+def sync_saved_bid(sender, instance, **kwargs):
+    sync_on_commit('bids', instance)
+
+@receiver(signals.post_delete, sender=Ask)
+def sync_deleted_ask(sender, instance, **kwargs):
+    sync_on_commit('asks', instance, deleted=True)
+
+@receiver(signals.post_delete, sender=Bid)
+def sync_deleted_bid(sender, instance, **kwargs):
+    sync_on_commit('bids', instance, deleted=True)
@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta
+from decimal  import Decimal, InvalidOperation
+
+from django.db        import transaction
+from django.db.models import OuterRef, Subquery
+
+from user.models    import ShippingInformation
+from product.models import ProductSize, product_versions
+from order.models   import Ask, Bid, Order, MarketSummary, order_statuses, order_status_id
+from order.book     import order_books, order_book_enabled
+from order.numbers  import order_numbers
+
+BUY                      = 'buy'
+SELL                     = 'sell'
+ORDER_STATUS_CURRENT     = 'current'
+ORDER_STATUS_PENDING     = 'pending'
+BULK_ORDER_LIMIT         = 100
+REQUIRED_SHIPPING_FIELDS = ['name', 'country', 'primary_address', 'city', 'postal_code', 'phone_number']
+
+SIDES = {
+    BUY  : {'model': Bid, 'prefix': 'B', 'counter_model': Ask, 'counter_prefix': 'A', 'counter_error': 'ASK_DOES_NOT_EXIST'},
+    SELL : {'model': Ask, 'prefix': 'A', 'counter_model': Bid, 'counter_prefix': 'B', 'counter_error': 'BID_DOES_NOT_EXIST'},
+}
+
+class OrderError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status  = status
+
+def best_counter_order(side, product_size, limit=None):
+    if order_book_enabled():
+        counter_order = order_books.best_ask(product_size.id, lock=True, limit=limit) if side == BUY\
+            else order_books.best_bid(product_size.id, lock=True, limit=limit)
+
+        # orders written by other worker processes never reach this process's book,
+        # so a miss is confirmed against the table before the order rests or fails
+        if counter_order:
+            return counter_order
+
+    if side == BUY:
+        orders = Ask.objects.filter(product_size=product_size).order_by('price')
+        orders = orders if limit is None else orders.filter(price__lte=limit)
+    else:
+        orders = Bid.objects.filter(product_size=product_size).order_by('-price')
+        orders = orders if limit is None else orders.filter(price__gte=limit)
+
+    return orders.filter(order_status_id=order_status_id(ORDER_STATUS_CURRENT))\
+            .select_for_update(skip_locked=True).first()
+
+def validate_shipping(side, shipping):
+    if side not in SIDES:
+        raise OrderError('INVALID_VALUE')
+
+    if not all(shipping.get(field) for field in REQUIRED_SHIPPING_FIELDS):
+        raise OrderError('KEY_ERROR')
+
+def validate_order(price, instant, expiration_days, total_price):
+    if not price:
+        raise OrderError('KEY_ERROR')
+
+    if instant and not total_price:
+        raise OrderError('KEY_ERROR')
+
+    if not instant and not expiration_days:
+        raise OrderError('KEY_ERROR')
+
+    try:
+        price           = Decimal(str(price))
+        total_price     = Decimal(str(total_price)) if instant else None
+        expiration_days = None if instant else int(expiration_days)
+    except (InvalidOperation, ValueError):
+        raise OrderError('INVALID_VALUE')
+
+    if price <= 0 or (instant and total_price <= 0) or (not instant and expiration_days <= 0):
+        raise OrderError('INVALID_VALUE')
+
+    return price, expiration_days, total_price
+
+def validate(side, price, shipping, instant, expiration_days, total_price):
+    validate_shipping(side, shipping)
+
+    return validate_order(price, instant, expiration_days, total_price)
+
+def submit(side, user, product_size, price, shipping, instant=False, expiration_days=None, total_price=None):
+    price, expiration_days, total_price = validate(side, price, shipping, instant, expiration_days, total_price)
+
+    config = SIDES[side]
+    now    = datetime.now()
+
+    with transaction.atomic():
+        counter_order = best_counter_order(side, product_size, price)
+
+        if instant and not counter_order:
+            raise OrderError(config['counter_error'], status=404)
+
+        shipping_information, created = ShippingInformation.objects.upsert(user, shipping)
+
+        if not counter_order:
+            order = config['model'].objects.create(
+                user_id              = user.id,
+                product_size         = product_size,
+                price                = price,
+                expiration_date      = now + timedelta(days=expiration_days),
+                order_status         = order_statuses.get(ORDER_STATUS_CURRENT),
+                shipping_information = shipping_information
+            )
+
+            MarketSummary.objects.refresh(product_size.id)
+
+            return order, None
+
+        order_status_pending = order_statuses.get(ORDER_STATUS_PENDING)
+
+        # trades execute at the resting order's price; an instant quote keeps its fees on top of it
+        execution_price = counter_order.price
+        total_price     = execution_price + (total_price - price) if instant else execution_price
+
+        order = config['model'].objects.create(
+            user_id              = user.id,
+            product_size         = product_size,
+            price                = execution_price,
+            order_status         = order_status_pending,
+            matched_at           = now,
+            total_price          = total_price,
+            order_number         = order_numbers.allocate(config['prefix']),
+            shipping_information = shipping_information
+        )
+
+        counter_order.order_status = order_status_pending
+        counter_order.matched_at   = now
+        counter_order.total_price  = order.total_price
+        counter_order.order_number = order_numbers.allocate(config['counter_prefix'])
+        counter_order.save(update_fields=['order_status', 'matched_at', 'total_price', 'order_number'])
+
+        trade = Order.objects.create(
+            bid = order if side == BUY else counter_order,
+            ask = counter_order if side == BUY else order
+        )
+
+        MarketSummary.objects.refresh(product_size.id)
+
+    return order, trade
+
+def submit_bulk(side, user, shipping, items):
+    validate_shipping(side, shipping)
+
+    if len(items) > BULK_ORDER_LIMIT:
+        raise OrderError('TOO_MANY_ORDERS')
+
+    results = [None] * len(items)
+    orders  = []
+
+    for index, item in enumerate(items):
+        try:
+            price, expiration_days, total_price = validate_order(item.get('price'), False, item.get('expiration_days'), None)
+            key                                 = (int(item['product_id']), int(item['size_id']))
+        except OrderError as error:
+            results[index] = {'message': error.message}
+            continue
+        except (KeyError, TypeError, ValueError):
+            results[index] = {'message': 'KEY_ERROR'}
+            continue
+
+        orders.append((index, key, price, expiration_days))
+
+    counter_orders = (Bid if side == SELL else Ask).objects\
+            .filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))\
+            .order_by('-price' if side == SELL else 'price')
+
+    product_sizes = {
+        (product_size.product_id, product_size.size_id) : product_size
+        for product_size in ProductSize.objects.filter(
+            product_id__in = {key[0] for index, key, price, expiration_days in orders},
+            size_id__in    = {key[1] for index, key, price, expiration_days in orders}
+        ).annotate(best_counter_price=Subquery(counter_orders.values('price')[:1]))
+    }
+
+    now      = datetime.now()
+    resting  = []
+    crossing = []
+
+    for index, key, price, expiration_days in orders:
+        product_size = product_sizes.get(key)
+
+        if not product_size:
+            results[index] = {'message': 'PRODUCT_SIZE_DOES_NOT_EXIST'}
+        elif product_size.best_counter_price is not None and (
+                price <= product_size.best_counter_price if side == SELL else price >= product_size.best_counter_price):
+            crossing.append((index, product_size, price, expiration_days))
+        else:
+            resting.append((index, product_size, price, expiration_days))
+
+    if not (resting or crossing):
+        return results
+
+    with transaction.atomic():
+        shipping_information, created = ShippingInformation.objects.upsert(user, shipping)
+
+        SIDES[side]['model'].objects.bulk_create([SIDES[side]['model'](
+            user_id              = user.id,
+            product_size         = product_size,
+            price                = price,
+            expiration_date      = now + timedelta(days=expiration_days),
+            order_status         = order_statuses.get(ORDER_STATUS_CURRENT),
+            shipping_information = shipping_information
+        ) for index, product_size, price, expiration_days in resting])
+
+        for index, product_size, price, expiration_days in resting:
+            results[index] = {'message': 'SUCCESS'}
+
+        for index, product_size, price, expiration_days in crossing:
+            order, trade   = submit(side, user, product_size, price, shipping, expiration_days=expiration_days)
+            results[index] = {'message': 'MATCHED' if trade else 'SUCCESS'}
+
+        product_size_ids = {product_size.id for index, product_size, price, expiration_days in resting + crossing}
+
+        MarketSummary.objects.refresh_many(product_size_ids)
+        product_versions.touch(product_size_ids=product_size_ids)
+
+        if resting and order_book_enabled():
+            transaction.on_commit(lambda: order_books.load(list(product_size_ids)))
+
+    return results
@@ -0,0 +1,105 @@
+import threading
+from datetime import datetime
+
+from django.conf  import settings
+from django.db    import connection, transaction
+from django.utils import timezone
+
+from order.models   import Ask, Bid, MarketSummary, order_statuses, order_status_id
+from order.book     import order_books, order_book_enabled
+from product.models import product_versions
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_EXPIRED = 'expired'
+
+class ExpirationSweeper:
+    def __init__(self):
+        self.processed   = {'asks': 0, 'bids': 0}
+        self.last_run_at = None
+        self.lock        = threading.Lock()
+        self.timer       = None
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'processed'   : dict(self.processed),
+                'last_run_at' : self.last_run_at,
+            }
+
+    def sweep(self, batch_size=None, max_batches=None, now=None):
+        batch_size = batch_size or getattr(settings, 'ORDER_EXPIRATION_BATCH_SIZE', 500)
+        now        = now or datetime.now()
+        expired    = order_statuses.get(ORDER_STATUS_EXPIRED)
+        processed  = {}
+
+        for model, side in [(Ask, 'asks'), (Bid, 'bids')]:
+            processed[side] = 0
+            batches         = 0
+
+            while max_batches is None or batches < max_batches:
+                count = self.sweep_batch(model, side, expired, batch_size, now)
+
+                processed[side] += count
+                batches         += 1
+
+                if count < batch_size:
+                    break
+
+        with self.lock:
+            for side, count in processed.items():
+                self.processed[side] += count
+
+            self.last_run_at = now
+
+        return processed
+
+    def sweep_batch(self, model, side, expired, batch_size, now):
+        with transaction.atomic():
+            orders = list(model.objects
+                .filter(order_status_id=order_status_id(ORDER_STATUS_CURRENT), expiration_date__lte=now)
+                .order_by('expiration_date')
+                .select_for_update(skip_locked=True)
+                .values_list('id', 'product_size_id')[:batch_size])
+
+            if not orders:
+                return 0
+
+            model.objects.filter(id__in=[order_id for order_id, product_size_id in orders])\
+                    .update(order_status=expired, updated_at=timezone.now())
+
+            expired_orders = {}
+
+            for order_id, product_size_id in orders:
+                expired_orders.setdefault(product_size_id, []).append(order_id)
+
+            MarketSummary.objects.refresh_many(list(expired_orders))
+            product_versions.touch(product_size_ids=expired_orders)
+
+            if order_book_enabled():
+                transaction.on_commit(lambda: [
+                    order_books.remove(side, product_size_id, order_ids)
+                    for product_size_id, order_ids in expired_orders.items()
+                ])
+
+        return len(orders)
+
+    def start(self, interval):
+        def run():
+            try:
+                self.sweep()
+            finally:
+                connection.close()
+
+                if self.timer:
+                    self.start(interval)
+
+        self.timer        = threading.Timer(interval, run)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stop(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+expiration_sweeper = ExpirationSweeper()
@@ -0,0 +1,149 @@
+import time
+import uuid
+import logging
+from datetime import datetime
+
+from django.conf                import settings
+from django.db                  import connection, transaction
+from django.db.models.functions import Mod
+
+from order.models import OrderIntake
+from order        import engine
+
+INTAKE_STATUS_QUEUED   = 'queued'
+INTAKE_STATUS_ACCEPTED = 'accepted'
+INTAKE_STATUS_REJECTED = 'rejected'
+INTAKE_STATUS_FAILED   = 'failed'
+
+logger = logging.getLogger(__name__)
+
+def intake_enabled():
+    return getattr(settings, 'ORDER_INTAKE_ASYNC', False)
+
+def max_attempts():
+    return getattr(settings, 'ORDER_INTAKE_MAX_ATTEMPTS', 3)
+
+def enqueue(side, user, product_size, price, shipping, instant=False, expiration_days=None, total_price=None):
+    price, expiration_days, total_price = engine.validate(side, price, shipping, instant, expiration_days, total_price)
+
+    return OrderIntake.objects.create(
+        handle       = uuid.uuid4(),
+        user_id      = user.id,
+        product_size = product_size,
+        side         = side,
+        payload      = {
+            'price'           : str(price),
+            'shipping'        : shipping,
+            'instant'         : instant,
+            'expiration_days' : expiration_days,
+            'total_price'     : str(total_price) if total_price is not None else None,
+        }
+    )
+
+def process(intake_id):
+    try:
+        return settle(intake_id)
+    except Exception:
+        logger.exception('order intake %s failed', intake_id)
+
+        return fail(intake_id)
+
+def settle(intake_id):
+    with transaction.atomic():
+        intake = OrderIntake.objects.select_for_update().filter(id=intake_id, status=INTAKE_STATUS_QUEUED).first()
+
+        if not intake:
+            return None
+
+        payload = intake.payload
+
+        try:
+            order, trade = engine.submit(
+                intake.side,
+                intake.user,
+                intake.product_size,
+                payload['price'],
+                payload['shipping'],
+                instant         = payload['instant'],
+                expiration_days = payload['expiration_days'],
+                total_price     = payload['total_price']
+            )
+        except engine.OrderError as error:
+            intake.status  = INTAKE_STATUS_REJECTED
+            intake.message = error.message
+        else:
+            intake.status  = INTAKE_STATUS_ACCEPTED
+            intake.message = 'MATCHED' if trade else 'SUCCESS'
+
+            setattr(intake, 'bid' if intake.side == engine.BUY else 'ask', order)
+
+        intake.processed_at = datetime.now()
+        intake.save(update_fields=['status', 'message', 'ask', 'bid', 'processed_at'])
+
+    return intake
+
+def fail(intake_id):
+    with transaction.atomic():
+        intake = OrderIntake.objects.select_for_update().filter(id=intake_id, status=INTAKE_STATUS_QUEUED).first()
+
+        if not intake:
+            return None
+
+        intake.attempts += 1
+
+        # a failing intake stays queued for a retry until it runs out of attempts
+        if intake.attempts >= max_attempts():
+            intake.status       = INTAKE_STATUS_FAILED
+            intake.message      = 'INTERNAL_ERROR'
+            intake.processed_at = datetime.now()
+
+        intake.save(update_fields=['attempts', 'status', 'message', 'processed_at'])
+
+    return intake
+
+def process_pending(shard=0, shards=1, batch_size=100):
+    processed = 0
+
+    while True:
+        intakes = list(OrderIntake.objects
+            .annotate(shard=Mod('product_size_id', shards))
+            .filter(status=INTAKE_STATUS_QUEUED, shard=shard)
+            .order_by('id')
+            .values_list('id', 'product_size_id')[:batch_size])
+        blocked = set()
+
+        for intake_id, product_size_id in intakes:
+            # a size whose earlier intake is waiting on a retry keeps its later intakes queued behind it
+            if product_size_id in blocked:
+                continue
+
+            intake = process(intake_id)
+
+            if not intake:
+                continue
+
+            if intake.status == INTAKE_STATUS_QUEUED:
+                blocked.add(product_size_id)
+            else:
+                processed += 1
+
+        if len(intakes) < batch_size:
+            return processed
+
+def work(shard=0, shards=1, batch_size=100, interval=1.0, once=False):
+    try:
+        while True:
+            try:
+                processed = process_pending(shard, shards, batch_size)
+            except Exception:
+                logger.exception('order intake shard %s failed', shard)
+                connection.close()
+                processed = 0
+
+            if once:
+                return processed
+
+            if not processed:
+                time.sleep(interval)
+    finally:
+        connection.close()
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from collections import Counter
+
+import jwt
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import connection
+from django.db.models            import Count
+from django.test                 import Client
+
+from my_settings                 import SECRET_KEY, ALGORITHM
+from user.models                 import User, ShippingInformation
+from product.models              import Product, Size, ProductSize
+from order.models                import Ask, Order, OrderStatus
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_PENDING = 'pending'
+
+class Command(BaseCommand):
+    help = 'Run concurrent instant buys against one product size and check that no ask is matched twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--asks', type=int, default=200)
+
+    def handle(self, *args, **options):
+        user, product, size = self.seed(options['asks'])
+
+        try:
+            token    = jwt.encode({'email': user.email}, SECRET_KEY, algorithm=ALGORITHM)
+            url      = f'/order/buy/{product.id}?size={size.id}'
+            statuses = Counter()
+            lock     = threading.Lock()
+            payload  = json.dumps({
+                'isBid'          : '0',
+                'price'          : '100.00',
+                'name'           : 'bench',
+                'country'        : 'bench',
+                'primaryAddress' : 'bench',
+                'city'           : 'bench',
+                'postalCode'     : 'bench',
+                'phoneNumber'    : 'bench',
+                'totalPrice'     : '110.00'
+            })
+
+            def buy():
+                client = Client(raise_request_exception=False)
+
+                try:
+                    while True:
+                        response = client.post(url, payload, content_type='application/json', HTTP_AUTHORIZATION=token)
+
+                        with lock:
+                            statuses[response.status_code] += 1
+
+                        if response.status_code == 404:
+                            break
+                finally:
+                    connection.close()
+
+            threads    = [threading.Thread(target=buy) for _ in range(options['threads'])]
+            started_at = time.perf_counter()
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+            elapsed = time.perf_counter() - started_at
+            orders  = Order.objects.filter(ask__product_size__product=product)
+            matched = orders.count()
+            doubled = orders.values('ask_id').annotate(count=Count('id')).filter(count__gt=1).count()
+
+            self.stdout.write(f'threads: {options["threads"]}, asks: {options["asks"]}, responses: {dict(statuses)}')
+            self.stdout.write(f'matched {matched} asks in {elapsed:.2f}s ({matched / elapsed:.1f} matches/s)')
+            self.stdout.write(f'asks matched more than once: {doubled}')
+        finally:
+            product.delete()
+            size.delete()
+            user.delete()
+
+        if doubled or matched != options['asks']:
+            raise CommandError('concurrent matching lost or double filled asks')
+
+        self.stdout.write(self.style.SUCCESS('every ask was matched exactly once'))
+
+    def seed(self, count):
+        user    = User.objects.create(email=f'bench-{time.time()}@shockx', name='bench')
+        product = Product.objects.create(
+            name          = 'bench',
+            model_number  = 'bench',
+            ticker_number = 'bench',
+            color         = 'bench',
+            description   = 'bench',
+            retail_price  = 100,
+            release_date  = '2021-01-01'
+        )
+        size                 = Size.objects.create(name='bench')
+        product_size         = ProductSize.objects.create(product=product, size=size)
+        order_status, _      = OrderStatus.objects.get_or_create(name=ORDER_STATUS_CURRENT)
+        shipping_information = ShippingInformation.objects.create(
+            user            = user,
+            name            = 'bench',
+            country         = 'bench',
+            primary_address = 'bench',
+            city            = 'bench',
+            postal_code     = 'bench',
+            phone_number    = 'bench'
+        )
+        OrderStatus.objects.get_or_create(name=ORDER_STATUS_PENDING)
+
+        Ask.objects.bulk_create([Ask(
+            user                 = user,
+            product_size         = product_size,
+            price                = 100,
+            order_status         = order_status,
+            shipping_information = shipping_information
+        ) for _ in range(count)])
+
+        return user, product, size
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db                   import connection, transaction
+from django.test.utils           import CaptureQueriesContext
+
+from user.models                 import User
+from product.models              import Product, Size, ProductSize
+from order.models                import OrderStatus
+from order.engine                import submit, BUY, SELL
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_PENDING = 'pending'
+
+SHIPPING = {
+    'name'            : 'bench',
+    'country'         : 'bench',
+    'primary_address' : 'bench',
+    'city'            : 'bench',
+    'postal_code'     : 'bench',
+    'phone_number'    : 'bench',
+}
+
+class Command(BaseCommand):
+    help = 'Measure latency and round trips of order.engine.submit without going through HTTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['orders']
+
+        with transaction.atomic():
+            user, product_size = self.seed()
+
+            resting = self.run(count, lambda index: submit(
+                SELL, user, product_size, 100 + index % 50, SHIPPING, expiration_days=30
+            ))
+            instant = self.run(count, lambda index: submit(
+                BUY, user, product_size, 150, SHIPPING, instant=True, total_price=160
+            ))
+
+            transaction.set_rollback(True)
+
+        for label, (elapsed, queries) in [('resting ask', resting), ('instant buy', instant)]:
+            self.stdout.write(
+                f'{label}: {elapsed / count * 1000:.2f} ms/order, {queries / count:.1f} queries/order'
+            )
+
+    def seed(self):
+        user    = User.objects.create(email=f'bench-{time.time()}@shockx', name='bench')
+        product = Product.objects.create(
+            name          = 'bench',
+            model_number  = 'bench',
+            ticker_number = 'bench',
+            color         = 'bench',
+            description   = 'bench',
+            retail_price  = 100,
+            release_date  = '2021-01-01'
+        )
+        OrderStatus.objects.get_or_create(name=ORDER_STATUS_CURRENT)
+        OrderStatus.objects.get_or_create(name=ORDER_STATUS_PENDING)
+
+        return user, ProductSize.objects.create(product=product, size=Size.objects.create(name='bench'))
+
+    def run(self, count, place):
+        with CaptureQueriesContext(connection) as context:
+            started_at = time.perf_counter()
+
+            for index in range(count):
+                place(index)
+
+            elapsed = time.perf_counter() - started_at
+
+        return elapsed, len(context.captured_queries)
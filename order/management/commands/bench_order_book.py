@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db                   import transaction
+from django.test.utils           import override_settings
+
+from user.models                 import User, ShippingInformation
+from product.models              import Product, Size, ProductSize
+from order.models                import Ask, OrderStatus, order_status_id
+from order.book                  import order_books
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_PENDING = 'pending'
+
+class Command(BaseCommand):
+    help = 'Compare best ask lookups per second of the indexed query and the in-memory order book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--lookups', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            query_size, book_size = self.seed(options['orders'])
+
+            query_rate = self.run(options['lookups'], lambda: Ask.objects\
+                    .filter(product_size=query_size, order_status_id=order_status_id(ORDER_STATUS_CURRENT)).order_by('price').first())
+
+            with override_settings(ORDER_BOOK_ENABLED=True):
+                order_books.clear()
+                order_books.load([book_size.id])
+                book_rate  = self.run(options['lookups'], lambda: order_books.best_ask(book_size.id))
+                mismatches = order_books.check([book_size.id])
+                order_books.clear()
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'query     : {query_rate:10.1f} lookups/s')
+        self.stdout.write(f'order book: {book_rate:10.1f} lookups/s ({book_rate / query_rate:.1f}x)')
+        self.stdout.write(f'consistency mismatches: {len(mismatches)}')
+
+    def seed(self, count):
+        user    = User.objects.create(email=f'bench-{time.time()}@shockx', name='bench')
+        product = Product.objects.create(
+            name          = 'bench',
+            model_number  = 'bench',
+            ticker_number = 'bench',
+            color         = 'bench',
+            description   = 'bench',
+            retail_price  = 100,
+            release_date  = '2021-01-01'
+        )
+        size                 = Size.objects.create(name='bench')
+        order_status, _      = OrderStatus.objects.get_or_create(name=ORDER_STATUS_CURRENT)
+        shipping_information = ShippingInformation.objects.create(
+            user            = user,
+            name            = 'bench',
+            country         = 'bench',
+            primary_address = 'bench',
+            city            = 'bench',
+            postal_code     = 'bench',
+            phone_number    = 'bench'
+        )
+        OrderStatus.objects.get_or_create(name=ORDER_STATUS_PENDING)
+
+        product_sizes = [ProductSize.objects.create(product=product, size=size) for _ in range(2)]
+        prices        = [random.randint(100, 1000) for _ in range(count)]
+
+        for product_size in product_sizes:
+            Ask.objects.bulk_create([Ask(
+                user                 = user,
+                product_size         = product_size,
+                price                = price,
+                order_status         = order_status,
+                shipping_information = shipping_information
+            ) for price in prices], batch_size=1000)
+
+        return product_sizes
+
+    def run(self, lookups, best_ask):
+        order_status_pending = OrderStatus.objects.get(name=ORDER_STATUS_PENDING)
+        started_at           = time.perf_counter()
+
+        for _ in range(lookups):
+            ask = best_ask()
+
+            if not ask:
+                break
+
+            ask.order_status = order_status_pending
+            ask.save()
+
+        return lookups / (time.perf_counter() - started_at)
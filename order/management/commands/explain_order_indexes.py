@@ -0,0 +1,93 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import transaction
+
+from user.models                 import User, ShippingInformation
+from product.models              import Product, Size, ProductSize
+from order.models                import Ask, Bid, OrderStatus, order_status_id
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_HISTORY = 'history'
+ORDER_STATUSES       = ['current', 'pending', 'history']
+
+class Command(BaseCommand):
+    help = 'Seed asks and bids and check that order book queries use the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--product-sizes', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started_at   = time.perf_counter()
+            product_size = self.seed(options['rows'], options['product_sizes'], options['batch_size'])
+            self.stdout.write(f"seeded {options['rows']} asks and bids in {time.perf_counter() - started_at:.1f}s")
+
+            plans = [
+                ('lowest ask', 'asks_size_status_price_idx', Ask.objects\
+                    .filter(product_size=product_size, order_status_id=order_status_id(ORDER_STATUS_CURRENT)).order_by('price')[:1]),
+                ('highest bid', 'bids_size_status_price_idx', Bid.objects\
+                    .filter(product_size=product_size, order_status_id=order_status_id(ORDER_STATUS_CURRENT)).order_by('-price')[:1]),
+                ('sales history', 'asks_size_status_matched_idx', Ask.objects\
+                    .filter(product_size=product_size, order_status_id=order_status_id(ORDER_STATUS_HISTORY)).order_by('-matched_at')[:2]),
+            ]
+
+            missing = []
+
+            for name, index_name, queryset in plans:
+                plan = queryset.explain()
+                self.stdout.write(f'{name}:\n{plan}\n')
+
+                if index_name not in plan:
+                    missing.append(f'{name} ({index_name})')
+
+            transaction.set_rollback(True)
+
+        if missing:
+            raise CommandError(f"plans not using composite indexes: {', '.join(missing)}")
+
+        self.stdout.write(self.style.SUCCESS('all order book queries use composite indexes'))
+
+    def seed(self, rows, product_size_count, batch_size):
+        user    = User.objects.create(email=f'explain-{time.time()}@shockx', name='explain')
+        product = Product.objects.create(
+            name          = 'explain',
+            model_number  = 'explain',
+            ticker_number = 'explain',
+            color         = 'explain',
+            description   = 'explain',
+            retail_price  = 100,
+            release_date  = '2021-01-01'
+        )
+        size                 = Size.objects.create(name='explain')
+        shipping_information = ShippingInformation.objects.create(
+            user            = user,
+            name            = 'explain',
+            country         = 'explain',
+            primary_address = 'explain',
+            city            = 'explain',
+            postal_code     = 'explain',
+            phone_number    = 'explain'
+        )
+        order_statuses = [OrderStatus.objects.get_or_create(name=name)[0] for name in ORDER_STATUSES]
+        ProductSize.objects.bulk_create([ProductSize(product=product, size=size) for _ in range(product_size_count)])
+
+        product_sizes  = list(ProductSize.objects.filter(product=product))
+        now            = datetime.now()
+
+        for model in [Ask, Bid]:
+            for start in range(0, rows // 2, batch_size):
+                model.objects.bulk_create([model(
+                    user                 = user,
+                    product_size         = random.choice(product_sizes),
+                    price                = random.randint(100, 1000),
+                    order_status         = random.choice(order_statuses),
+                    matched_at           = now - timedelta(minutes=random.randint(0, 100000)),
+                    shipping_information = shipping_information
+                ) for _ in range(min(batch_size, rows // 2 - start))])
+
+        return product_sizes[0]
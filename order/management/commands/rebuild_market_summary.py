@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from order.models                import MarketSummary
+
+class Command(BaseCommand):
+    help = 'Rebuild the market summary of every product size from asks and bids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = MarketSummary.objects.rebuild(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} market summaries'))
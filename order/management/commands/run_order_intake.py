@@ -0,0 +1,40 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import connections
+
+from order.intake                import work
+
+class Command(BaseCommand):
+    help = 'Match queued order submissions, in order for each product size, with a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--shard', type=int, default=None)
+        parser.add_argument('--shards', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *args, **options):
+        worker_options = {'batch_size': options['batch_size'], 'interval': options['interval'], 'once': options['once']}
+
+        if options['shard'] is not None:
+            if not options['shards'] or not 0 <= options['shard'] < options['shards']:
+                raise CommandError('--shard needs --shards and must be lower than it')
+
+            processed = work(options['shard'], options['shards'], **worker_options)
+        elif options['workers'] == 1:
+            processed = work(0, 1, **worker_options)
+        else:
+            connections.close_all()
+
+            with multiprocessing.Pool(options['workers']) as pool:
+                processed = sum(pool.starmap(run_shard, [
+                    (shard, options['workers'], worker_options) for shard in range(options['workers'])
+                ]))
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} queued orders'))
+
+def run_shard(shard, shards, options):
+    return work(shard, shards, **options)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from order.expiration            import expiration_sweeper
+
+class Command(BaseCommand):
+    help = 'Move asks and bids whose expiration date has passed out of the current order book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        processed = expiration_sweeper.sweep(batch_size=options['batch_size'], max_batches=options['max_batches'])
+
+        self.stdout.write(f'expired_orders_processed{{side="asks"}} {processed["asks"]}')
+        self.stdout.write(f'expired_orders_processed{{side="bids"}} {processed["bids"]}')
+        self.stdout.write(self.style.SUCCESS(f'Expired {sum(processed.values())} orders'))
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.6 on 2026-10-18 21:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0001_initial'),
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lowest_ask', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('highest_bid', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('last_sale', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('previous_sale', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('total_sales', models.PositiveIntegerField(default=0)),
+                ('average_sale_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product_size', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='product.productsize')),
+            ],
+            options={
+                'db_table': 'market_summaries',
+            },
+        ),
+    ]
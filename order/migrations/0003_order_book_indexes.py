@@ -0,0 +1,29 @@
+# Generated by Django 3.1.6 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_marketsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ask',
+            index=models.Index(fields=['product_size', 'order_status', 'price'], name='asks_size_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ask',
+            index=models.Index(fields=['product_size', 'order_status', 'matched_at'], name='asks_size_status_matched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['product_size', 'order_status', 'price'], name='bids_size_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['product_size', 'order_status', 'matched_at'], name='bids_size_status_matched_idx'),
+        ),
+    ]
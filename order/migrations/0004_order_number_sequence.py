@@ -0,0 +1,24 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_order_book_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'order_number_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ask',
+            index=models.Index(fields=['order_status', 'expiration_date'], name='asks_status_expiration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['order_status', 'expiration_date'], name='bids_status_expiration_idx'),
+        ),
+    ]
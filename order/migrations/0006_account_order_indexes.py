@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_order_expiration_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ask',
+            index=models.Index(fields=['user', 'order_status', 'created_at'], name='asks_user_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['user', 'order_status', 'created_at'], name='bids_user_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_shippinginformation_fingerprint_unique'),
+        ('product', '0001_initial'),
+        ('order', '0006_account_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIntake',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('handle', models.UUIDField(unique=True)),
+                ('side', models.CharField(max_length=4)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(default='queued', max_length=10)),
+                ('message', models.CharField(max_length=45, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(null=True)),
+                ('ask', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='order.ask')),
+                ('bid', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='order.bid')),
+                ('product_size', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='product.productsize')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user.user')),
+            ],
+            options={
+                'db_table': 'order_intakes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderintake',
+            index=models.Index(fields=['status', 'id'], name='order_intakes_status_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_order_intake'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderintake',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
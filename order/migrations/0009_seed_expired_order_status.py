@@ -0,0 +1,27 @@
+# Generated by Django 3.1.6 on 2026-10-18 23:40
+
+from django.db        import migrations
+from django.db.models import Max
+
+ORDER_STATUS_EXPIRED = 'expired'
+
+def seed_expired_order_status(apps, schema_editor):
+    OrderStatus = apps.get_model('order', 'OrderStatus')
+
+    if OrderStatus.objects.filter(name=ORDER_STATUS_EXPIRED).exists():
+        return
+
+    # current, pending and history own ids 1 to 3 in the loaded data, so expired is placed after them
+    last_id = OrderStatus.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    OrderStatus.objects.create(id=max(last_id, 3) + 1, name=ORDER_STATUS_EXPIRED)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_order_intake_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_expired_order_status, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,18 @@
-from django.db      import models
+import time
+import threading
+from datetime import datetime
+from decimal  import Decimal
 
-from user.models    import User, ShippingInformation
-from product.models import ProductSize
+from django.conf      import settings
+from django.db        import models, transaction
+from django.db.models import Q, Avg, Count, OuterRef, Subquery, signals
+
+from user.models      import User, ShippingInformation
+from product.models   import ProductSize
+from utils            import ReferenceRegistry
+
+ORDER_STATUS_CURRENT = 'current'
+ORDER_STATUS_HISTORY = 'history'
 
 class ExpirationType(models.Model):
     name = models.CharField(max_length=45)
@@ -24,6 +35,12 @@ class Ask(models.Model):
 
     class Meta:
         db_table = 'asks'
+        indexes  = [
+            models.Index(fields=['product_size', 'order_status', 'price'], name='asks_size_status_price_idx'),
+            models.Index(fields=['product_size', 'order_status', 'matched_at'], name='asks_size_status_matched_idx'),
+            models.Index(fields=['order_status', 'expiration_date'], name='asks_status_expiration_idx'),
+            models.Index(fields=['user', 'order_status', 'created_at'], name='asks_user_status_created_idx'),
+        ]
 
 class Bid(models.Model):
     user                 = models.ForeignKey('user.User', on_delete=models.CASCADE)
@@ -40,6 +57,12 @@ class Bid(models.Model):
 
     class Meta:
         db_table = 'bids'
+        indexes  = [
+            models.Index(fields=['product_size', 'order_status', 'price'], name='bids_size_status_price_idx'),
+            models.Index(fields=['product_size', 'order_status', 'matched_at'], name='bids_size_status_matched_idx'),
+            models.Index(fields=['order_status', 'expiration_date'], name='bids_status_expiration_idx'),
+            models.Index(fields=['user', 'order_status', 'created_at'], name='bids_user_status_created_idx'),
+        ]
 
 class OrderStatus(models.Model):
     name = models.CharField(max_length=45)
@@ -47,9 +70,215 @@ class OrderStatus(models.Model):
     class Meta:
         db_table = 'order_status'
 
+order_statuses   = ReferenceRegistry(OrderStatus)
+expiration_types = ReferenceRegistry(ExpirationType)
+
+def order_status_id(name):
+    return order_statuses.id(name)
+
 class Order(models.Model):
     ask = models.ForeignKey('Ask', on_delete=models.CASCADE, null=True)
     bid = models.ForeignKey('Bid', on_delete=models.CASCADE, null=True)
 
     class Meta:
         db_table = 'orders'
+
+class OrderIntake(models.Model):
+    handle       = models.UUIDField(unique=True)
+    user         = models.ForeignKey('user.User', on_delete=models.CASCADE)
+    product_size = models.ForeignKey('product.ProductSize', on_delete=models.CASCADE)
+    side         = models.CharField(max_length=4)
+    payload      = models.JSONField()
+    status       = models.CharField(max_length=10, default='queued')
+    message      = models.CharField(max_length=45, null=True)
+    attempts     = models.PositiveSmallIntegerField(default=0)
+    ask          = models.ForeignKey('Ask', on_delete=models.SET_NULL, null=True)
+    bid          = models.ForeignKey('Bid', on_delete=models.SET_NULL, null=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'order_intakes'
+        indexes  = [
+            models.Index(fields=['status', 'id'], name='order_intakes_status_idx'),
+        ]
+
+class OrderNumberSequence(models.Model):
+    day        = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'order_number_sequences'
+
+def quantize_price(price):
+    return None if price is None else Decimal(price).quantize(Decimal('0.01'))
+
+SUMMARY_FIELDS = ['lowest_ask', 'highest_bid', 'last_sale', 'previous_sale', 'total_sales', 'average_sale_price']
+
+class MarketSummaryManager(models.Manager):
+    def compute(self, product_size_ids=None):
+        product_sizes = ProductSize.objects.all()
+        sales         = Ask.objects.filter(order_status_id=order_status_id(ORDER_STATUS_HISTORY))
+
+        if product_size_ids is not None:
+            product_sizes = product_sizes.filter(id__in=product_size_ids)
+            sales         = sales.filter(product_size_id__in=product_size_ids)
+
+        current_asks = Ask.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+        current_bids = Bid.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+        last_sales   = Ask.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_HISTORY))\
+                .order_by('-matched_at', '-id')
+
+        product_sizes = product_sizes.annotate(
+            lowest_ask    = Subquery(current_asks.order_by('price').values('price')[:1]),
+            highest_bid   = Subquery(current_bids.order_by('-price').values('price')[:1]),
+            last_sale     = Subquery(last_sales.values('price')[:1]),
+            previous_sale = Subquery(last_sales.values('price')[1:2])
+        )
+
+        statistics = {
+            sale['product_size_id'] : sale
+            for sale in sales.values('product_size_id').annotate(total=Count('id'), average=Avg('price'))
+        }
+
+        return [self.model(
+            product_size_id    = product_size.id,
+            lowest_ask         = quantize_price(product_size.lowest_ask),
+            highest_bid        = quantize_price(product_size.highest_bid),
+            last_sale          = quantize_price(product_size.last_sale),
+            previous_sale      = quantize_price(product_size.previous_sale),
+            total_sales        = statistics[product_size.id]['total'] if product_size.id in statistics else 0,
+            average_sale_price = quantize_price(statistics[product_size.id]['average']) if product_size.id in statistics else None
+        ) for product_size in product_sizes]
+
+    def refresh(self, product_size_id):
+        self.refresh_many([product_size_id])
+
+    def refresh_many(self, product_size_ids):
+        product_size_ids = sorted(set(product_size_ids))
+
+        with transaction.atomic():
+            # lock the summary rows before reading the orders so concurrent trades on a size recompute one after another
+            self.bulk_create([self.model(product_size_id=product_size_id) for product_size_id in product_size_ids],
+                ignore_conflicts=True)
+
+            summary_ids = dict(self.select_for_update().filter(product_size_id__in=product_size_ids)\
+                    .order_by('product_size_id').values_list('product_size_id', 'id'))
+            summaries   = self.compute(product_size_ids)
+            now         = datetime.now()
+
+            for summary in summaries:
+                summary.id         = summary_ids[summary.product_size_id]
+                summary.updated_at = now
+
+            self.bulk_update(summaries, SUMMARY_FIELDS + ['updated_at'])
+
+    def rebuild(self, batch_size=1000):
+        with transaction.atomic():
+            summaries = self.compute()
+            self.all().delete()
+            self.bulk_create(summaries, batch_size=batch_size)
+
+        return len(summaries)
+
+    def for_product_size(self, product_size_id):
+        return self.filter(product_size_id=product_size_id).first() or self.compute([product_size_id])[0]
+
+class MarketSummary(models.Model):
+    product_size       = models.OneToOneField('product.ProductSize', on_delete=models.CASCADE)
+    lowest_ask         = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    highest_bid        = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    last_sale          = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    previous_sale      = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    total_sales        = models.PositiveIntegerField(default=0)
+    average_sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    updated_at         = models.DateTimeField(auto_now=True)
+
+    objects = MarketSummaryManager()
+
+    class Meta:
+        db_table = 'market_summaries'
+
+class MarketValueCache:
+    def __init__(self):
+        self.values = {}
+        self.sizes  = {}
+        self.lock   = threading.Lock()
+
+        signals.post_save.connect(self.invalidate, sender=Ask, weak=False)
+        signals.post_delete.connect(self.invalidate, sender=Ask, weak=False)
+        signals.post_save.connect(self.invalidate_product_size, sender=ProductSize, weak=False)
+        signals.post_delete.connect(self.invalidate_product_size, sender=ProductSize, weak=False)
+
+    def ttl(self):
+        return getattr(settings, 'MARKET_VALUE_CACHE_TTL', 300)
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+            self.sizes  = {}
+
+    def compute(self, product_ids):
+        sizes         = {}
+        size_averages = {}
+
+        for product_size_id, product_id, size_avg in ProductSize.objects\
+                .filter(product_id__in=product_ids)\
+                .annotate(size_avg=Avg('ask__price', filter=Q(ask__order_status_id=order_status_id(ORDER_STATUS_HISTORY))))\
+                .values_list('id', 'product_id', 'size_avg'):
+            sizes[product_size_id] = product_id
+
+            if size_avg is not None:
+                size_averages.setdefault(product_id, []).append(size_avg)
+
+        return sizes, {
+            product_id : sum(size_averages[product_id]) / len(size_averages[product_id]) if product_id in size_averages else None
+            for product_id in product_ids
+        }
+
+    def get_many(self, product_ids):
+        now = time.monotonic()
+
+        with self.lock:
+            cached = {
+                product_id : self.values[product_id][1]
+                for product_id in product_ids if product_id in self.values and self.values[product_id][0] > now
+            }
+
+        missing = [product_id for product_id in set(product_ids) if product_id not in cached]
+
+        if missing:
+            sizes, computed = self.compute(missing)
+
+            with self.lock:
+                self.sizes.update(sizes)
+
+                for product_id, value in computed.items():
+                    self.values[product_id] = (now + self.ttl(), value)
+
+            cached.update(computed)
+
+        return cached
+
+    def discard(self, product_id):
+        with self.lock:
+            self.values.pop(product_id, None)
+
+    def invalidate(self, instance, **kwargs):
+        if instance.order_status_id != order_status_id(ORDER_STATUS_HISTORY):
+            return
+
+        # every size of a cached product is known, so a size missing here belongs to a product that is not cached
+        product_id = self.sizes.get(instance.product_size_id)
+
+        if product_id is None:
+            return
+
+        # discarding again on commit keeps a concurrent reader from caching the pre-trade value
+        self.discard(product_id)
+        transaction.on_commit(lambda: self.discard(product_id))
+
+    def invalidate_product_size(self, instance, **kwargs):
+        self.discard(instance.product_id)
+
+market_values = MarketValueCache()
@@ -0,0 +1,96 @@
+import threading
+from datetime import date
+
+from django.conf import settings
+from django.db   import connection, transaction
+
+from order.models import OrderNumberSequence
+from utils        import on_commit_hook
+
+ORDER_NUMBER_LENGTH = 5
+
+class OrderNumberBlock:
+    def __init__(self, day, start, end, committed):
+        self.day       = day
+        self.next      = start
+        self.end       = end
+        self.committed = committed
+        self.hook      = None if committed else on_commit_hook(self.commit)
+
+    def commit(self):
+        self.committed = True
+
+    def usable(self, day):
+        if self.day != day or self.next > self.end:
+            return False
+
+        # a block reserved inside a transaction that rolled back can be handed out again by another process
+        return self.committed or self.hook() is not None
+
+class OrderNumberAllocator:
+    def __init__(self):
+        self.block = None
+        self.lock  = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.block = None
+
+    def block_size(self):
+        return getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 100)
+
+    def reserve(self, day):
+        # inside an order transaction the sequence row lock would be held until the order commits,
+        # so the block is reserved on a separate connection that commits right away
+        if connection.in_atomic_block and connection.features.has_select_for_update:
+            start, end = self.reserve_detached(day)
+
+            return OrderNumberBlock(day, start, end, committed=True)
+
+        start, end = self.reserve_block(day)
+
+        return OrderNumberBlock(day, start, end, committed=not connection.in_atomic_block)
+
+    def reserve_block(self, day):
+        size = self.block_size()
+
+        with transaction.atomic():
+            sequence, created = OrderNumberSequence.objects.select_for_update().get_or_create(day=day)
+            sequence.last_value += size
+            sequence.save(update_fields=['last_value'])
+
+        return sequence.last_value - size + 1, sequence.last_value
+
+    def reserve_detached(self, day):
+        result = {}
+
+        def run():
+            try:
+                result['block'] = self.reserve_block(day)
+            except Exception as error:
+                result['error'] = error
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+        if 'error' in result:
+            raise result['error']
+
+        return result['block']
+
+    def allocate(self, prefix):
+        today = date.today()
+
+        with self.lock:
+            if not (self.block and self.block.usable(today)):
+                self.block = self.reserve(today)
+
+            value            = self.block.next
+            self.block.next += 1
+
+        return prefix + today.strftime('%y%m%d') + str(value).zfill(ORDER_NUMBER_LENGTH)
+
+order_numbers = OrderNumberAllocator()
@@ -1,20 +1,36 @@
 import json
 import jwt
 from datetime import datetime, timedelta
-
-from django.test    import TestCase, Client
-from unittest.mock  import patch, MagicMock
-
-from user.models    import User, ShippingInformation
-from product.models import Product, Size, ProductSize, Image
-from order.models   import Ask, Order, OrderStatus, Bid
-from my_settings    import SECRET_KEY, ALGORITHM
+from decimal  import Decimal
+from io       import StringIO
+
+from django.db              import connection, transaction, OperationalError
+from django.test            import TestCase, TransactionTestCase, Client, override_settings
+from django.core.management import call_command
+from unittest.mock          import patch, MagicMock
+
+from user.models      import User, ShippingInformation
+from product.models   import Product, Size, ProductSize, Image, sizes
+from order.models     import Ask, Order, OrderStatus, Bid, MarketSummary, OrderNumberSequence, OrderIntake, order_statuses
+from order.book       import BookSide, order_books, order_book_reconciler
+from order            import engine
+from order.engine     import submit, OrderError, BUY, SELL
+from order.numbers    import order_numbers
+from order.expiration import expiration_sweeper
+from order.intake     import process_pending
+from my_settings      import SECRET_KEY, ALGORITHM
 
 ORDER_STATUS_CURRENT = 'current'
 ORDER_STATUS_PENDING = 'pending'
 
 client = Client()
 
+def run_commit_hooks():
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+
+    for sids, func in callbacks:
+        func()
+
 class SellTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -114,6 +130,21 @@ class SellTest(TestCase):
         self.assertEqual(response.json()['data']['shippingInfo']['phoneNumber'], "01012341234")
         self.assertEqual(response.status_code, 200)
 
+    def test_sell_get_size_unknown_to_the_size_registry(self):
+        headers = {'HTTP_Authorization':self.token}
+
+        sizes.all()
+
+        # bulk_create sends no signals, like a size created by another process
+        Size.objects.bulk_create([Size(name='2')])
+        size = Size.objects.get(name='2')
+        ProductSize.objects.create(product=self.product, size=size)
+
+        response = client.get(f'/order/sell/{self.product.id}?size={size.id}', **headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['product']['size'], "2")
+
     def test_sell_get_does_not_exist2(self):
         headers = {'HTTP_Authorization':self.token}
 
@@ -701,9 +732,11 @@ class BuyStatusTest(TestCase):
             product_id = 1
         )
         OrderStatus.objects.create(
+            id   = 1,
             name = 'current'
         )
         OrderStatus.objects.create(
+            id   = 2,
             name = 'pending'
         )
         ShippingInformation.objects.create(
@@ -800,7 +833,8 @@ class BuyStatusTest(TestCase):
                             "purchaseDate" : "2020/11/10",
                         }
                     ],
-                    "username" : "shocking"
+                    "username"   : "shocking",
+                    "nextCursor" : {"current": None, "pending": None}
                 }
             }
                 
@@ -957,10 +991,1023 @@ class SellStatusTest(TestCase):
                             "purchaseDate" : "2020/11/10",
                         }
                     ],
-                    "username" : "shocking"
+                    "username"   : "shocking",
+                    "nextCursor" : {"current": None, "pending": None}
                 }
             }
 
             )
         self.assertEqual(response.status_code, 200)
 
+
+class MarketSummaryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(
+            email = 'shockx@wecode.com',
+            name  = 'shocking',
+        )
+        cls.product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.size = Size.objects.create(
+            name = '1'
+        )
+        cls.product_size = ProductSize.objects.create(
+            product = cls.product,
+            size    = cls.size
+        )
+        Image.objects.create(
+            image_url = 'a.jpg',
+            product   = cls.product
+        )
+        order_status_current = OrderStatus.objects.create(
+            name = 'current'
+        )
+        OrderStatus.objects.create(
+            name = 'pending'
+        )
+        order_status_history = OrderStatus.objects.create(
+            name = 'history'
+        )
+        shipping_information = ShippingInformation.objects.create(
+            name            = 'shock',
+            country         = 'South Korea',
+            primary_address = 'Gangnam-gu',
+            city            = 'Seoul',
+            postal_code     = '123456',
+            phone_number    = '123123123',
+            user            = user
+        )
+        for price in [150.00, 120.00]:
+            Ask.objects.create(
+                product_size         = cls.product_size,
+                price                = price,
+                user                 = user,
+                expiration_date      = '2020-03-31',
+                order_status         = order_status_current,
+                shipping_information = shipping_information
+            )
+        for price, matched_at in [(100.00, '2020-11-10'), (110.00, '2020-11-11')]:
+            Ask.objects.create(
+                product_size         = cls.product_size,
+                price                = price,
+                user                 = user,
+                matched_at           = matched_at,
+                order_status         = order_status_history,
+                shipping_information = shipping_information
+            )
+        Bid.objects.create(
+            product_size         = cls.product_size,
+            price                = 90.00,
+            user                 = user,
+            expiration_date      = '2020-03-31',
+            order_status         = order_status_current,
+            shipping_information = shipping_information
+        )
+
+        cls.token = jwt.encode({'email':user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def test_market_summary_rebuild_success(self):
+        call_command('rebuild_market_summary', stdout=StringIO())
+
+        summary = MarketSummary.objects.get(product_size=self.product_size)
+
+        self.assertEqual(summary.lowest_ask, Decimal('120.00'))
+        self.assertEqual(summary.highest_bid, Decimal('90.00'))
+        self.assertEqual(summary.last_sale, Decimal('110.00'))
+        self.assertEqual(summary.previous_sale, Decimal('100.00'))
+        self.assertEqual(summary.total_sales, 2)
+        self.assertEqual(summary.average_sale_price, Decimal('105.00'))
+
+    def test_market_summary_updated_on_buy(self):
+        headers = {'HTTP_Authorization':self.token}
+
+        call_command('rebuild_market_summary', stdout=StringIO())
+
+        data = {
+            "isBid"          : "0",
+            "price"          : "120.00",
+            "name"           : "sua",
+            "country"        : "South Korea",
+            "primaryAddress" : "Gangnam-gu",
+            "city"           : "Seoul",
+            "postalCode"     : "123456",
+            "phoneNumber"    : "01012341234",
+            "totalPrice"     : "125.00"
+        }
+
+        response = client.post(f'/order/buy/{self.product.id}?size={self.size.id}', json.dumps(data), content_type='application/json', **headers)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MarketSummary.objects.get(product_size=self.product_size).lowest_ask, Decimal('150.00'))
+
+    def test_market_summary_served_on_buy_get(self):
+        headers = {'HTTP_Authorization':self.token}
+
+        response = client.get(f'/order/buy/{self.product.id}?size={self.size.id}', **headers)
+
+        self.assertEqual(response.json()['data']['product']['lowestAsk'], "120.00")
+        self.assertEqual(response.json()['data']['product']['highestBid'], "90.00")
+        self.assertFalse(MarketSummary.objects.filter(product_size=self.product_size).exists())
+
+    def test_market_summary_refresh_updates_rows_in_place(self):
+        MarketSummary.objects.refresh(self.product_size.id)
+        summary = MarketSummary.objects.get(product_size=self.product_size)
+
+        Ask.objects.filter(product_size=self.product_size, price=120.00).delete()
+        MarketSummary.objects.refresh_many([self.product_size.id, self.product_size.id])
+
+        refreshed = MarketSummary.objects.get(product_size=self.product_size)
+
+        self.assertEqual(refreshed.id, summary.id)
+        self.assertEqual((summary.lowest_ask, refreshed.lowest_ask), (Decimal('120.00'), Decimal('150.00')))
+        self.assertGreaterEqual(refreshed.updated_at, summary.updated_at)
+
+@override_settings(ORDER_BOOK_ENABLED=True)
+class OrderBookTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email = 'shockx@wecode.com',
+            name  = 'shocking',
+        )
+        cls.product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.size = Size.objects.create(
+            name = '1'
+        )
+        cls.product_size = ProductSize.objects.create(
+            product = cls.product,
+            size    = cls.size
+        )
+        Image.objects.create(
+            image_url = 'a.jpg',
+            product   = cls.product
+        )
+        cls.order_status_current = OrderStatus.objects.create(
+            name = 'current'
+        )
+        cls.order_status_pending = OrderStatus.objects.create(
+            name = 'pending'
+        )
+        cls.shipping_information = ShippingInformation.objects.create(
+            name            = 'shock',
+            country         = 'South Korea',
+            primary_address = 'Gangnam-gu',
+            city            = 'Seoul',
+            postal_code     = '123456',
+            phone_number    = '123123123',
+            user            = cls.user
+        )
+
+        cls.token = jwt.encode({'email':cls.user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def setUp(self):
+        order_books.clear()
+
+    def tearDown(self):
+        order_books.clear()
+
+    def create_ask(self, price):
+        return Ask.objects.create(
+            product_size         = self.product_size,
+            price                = price,
+            user                 = self.user,
+            order_status         = self.order_status_current,
+            shipping_information = self.shipping_information
+        )
+
+    def test_book_side_price_time_priority(self):
+        asks = BookSide(1)
+        bids = BookSide(-1)
+
+        for order_id, price in [(1, 120), (2, 100), (3, 100), (4, 130)]:
+            asks.add(order_id, Decimal(price))
+            bids.add(order_id, Decimal(price))
+
+        asks.discard(2)
+
+        self.assertEqual(asks.pop(), (3, Decimal(100)))
+        self.assertEqual(asks.pop(), (1, Decimal(120)))
+        self.assertEqual(bids.pop(), (4, Decimal(130)))
+        self.assertEqual(bids.best(), (1, Decimal(120)))
+
+    def test_order_book_synced_on_save(self):
+        self.create_ask(150)
+        order_books.load([self.product_size.id])
+
+        lowest_ask = self.create_ask(120)
+        run_commit_hooks()
+        self.assertEqual(order_books.best_ask(self.product_size.id), lowest_ask)
+
+        lowest_ask.order_status = self.order_status_pending
+        lowest_ask.save()
+        run_commit_hooks()
+
+        self.assertEqual(order_books.best_ask(self.product_size.id).price, Decimal('150.00'))
+        self.assertEqual(order_books.check(), [])
+
+    def test_order_book_ignores_rolled_back_writes(self):
+        order_books.load([self.product_size.id])
+
+        with transaction.atomic():
+            self.create_ask(120)
+            transaction.set_rollback(True)
+
+        run_commit_hooks()
+
+        self.assertEqual(order_books.get(self.product_size.id).asks.snapshot(), {})
+
+    def test_reconciler_repairs_drifted_books(self):
+        ask = self.create_ask(150)
+        order_books.load([self.product_size.id])
+
+        Ask.objects.filter(id=ask.id).update(order_status=self.order_status_pending)
+        lowest_ask = self.create_ask(120)
+        before     = order_book_reconciler.metrics()['repaired']
+
+        self.assertEqual(len(order_book_reconciler.reconcile()), 1)
+        self.assertEqual(order_books.get(self.product_size.id).asks.snapshot(), {lowest_ask.id: Decimal('120.00')})
+        self.assertEqual(order_books.check(), [])
+        self.assertEqual(order_book_reconciler.metrics()['repaired'], before + 1)
+
+    def test_order_book_check_reports_stale_orders(self):
+        ask = self.create_ask(150)
+        order_books.load([self.product_size.id])
+
+        Ask.objects.filter(id=ask.id).update(order_status=self.order_status_pending)
+
+        self.assertEqual(order_books.check()[0]['stale'], [ask.id])
+        self.assertIsNone(order_books.best_ask(self.product_size.id))
+
+    def test_buy_matches_lowest_ask_from_order_book(self):
+        headers = {'HTTP_Authorization':self.token}
+
+        self.create_ask(150)
+        lowest_ask = self.create_ask(120)
+        order_books.load()
+
+        data = {
+            "isBid"          : "0",
+            "price"          : "120.00",
+            "name"           : "sua",
+            "country"        : "South Korea",
+            "primaryAddress" : "Gangnam-gu",
+            "city"           : "Seoul",
+            "postalCode"     : "123456",
+            "phoneNumber"    : "01012341234",
+            "totalPrice"     : "125.00"
+        }
+
+        response = client.post(f'/order/buy/{self.product.id}?size={self.size.id}', json.dumps(data), content_type='application/json', **headers)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().ask, lowest_ask)
+        self.assertEqual(order_books.best_ask(self.product_size.id).price, Decimal('150.00'))
+
+class OrderIndexTest(TestCase):
+    def test_order_book_queries_use_composite_indexes(self):
+        stdout = StringIO()
+
+        call_command('explain_order_indexes', rows=2000, product_sizes=20, stdout=stdout)
+
+        self.assertIn('all order book queries use composite indexes', stdout.getvalue())
+
+class ReferenceRegistryTest(TestCase):
+    def test_order_status_registry_resolves_names(self):
+        current = OrderStatus.objects.create(name='current')
+
+        self.assertEqual(order_statuses.id('current'), current.id)
+        self.assertIsNone(order_statuses.id('pending'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(order_statuses.get('current'), current)
+
+    def test_order_status_registry_invalidated_on_change(self):
+        OrderStatus.objects.create(name='current')
+        order_statuses.all()
+
+        pending = OrderStatus.objects.create(name='pending')
+        self.assertEqual(order_statuses.id('pending'), pending.id)
+
+        pending.delete()
+        with self.assertRaises(OrderStatus.DoesNotExist):
+            order_statuses.get('pending')
+
+class SellWithoutBidTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(
+            email = 'shockx@wecode.com',
+            name  = 'shocking',
+        )
+        cls.product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.size = Size.objects.create(
+            name = '1'
+        )
+        ProductSize.objects.create(
+            product = cls.product,
+            size    = cls.size
+        )
+        OrderStatus.objects.create(
+            name = 'current'
+        )
+        OrderStatus.objects.create(
+            name = 'pending'
+        )
+
+        cls.token = jwt.encode({'email':user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def test_sell_post_bid_does_not_exist(self):
+        headers = {'HTTP_Authorization':self.token}
+
+        data = {
+            "isAsk"          : "0",
+            "price"          : "100.00",
+            "name"           : "bongbong",
+            "country"        : "InSideOut",
+            "primaryAddress" : "bongbong_station",
+            "city"           : "dream",
+            "postalCode"     : "123456",
+            "phoneNumber"    : "01012341234",
+            "expirationDate" : "3",
+            "totalPrice"     : "125.00"
+        }
+
+        response = client.post(f'/order/sell/{self.product.id}?size={self.size.id}',\
+                json.dumps(data), content_type='application/json', **headers)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message':'BID_DOES_NOT_EXIST'})
+        self.assertFalse(Ask.objects.exists())
+        self.assertFalse(ShippingInformation.objects.exists())
+
+class OrderEngineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer  = User.objects.create(email='buyer@wecode.com', name='buyer')
+        cls.seller = User.objects.create(email='seller@wecode.com', name='seller')
+        product    = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.product_size = ProductSize.objects.create(
+            product = product,
+            size    = Size.objects.create(name='1')
+        )
+        OrderStatus.objects.create(name=ORDER_STATUS_CURRENT)
+        OrderStatus.objects.create(name=ORDER_STATUS_PENDING)
+
+        cls.shipping = {
+            'name'            : 'bongbong',
+            'country'         : 'InSideOut',
+            'primary_address' : 'bongbong_station',
+            'city'            : 'dream',
+            'postal_code'     : '123456',
+            'phone_number'    : '01012341234',
+        }
+
+    def test_engine_rests_orders_with_future_expiration(self):
+        ask, trade = submit(SELL, self.seller, self.product_size, '200.00', self.shipping, expiration_days='3')
+
+        self.assertIsNone(trade)
+        self.assertEqual(ask.order_status.name, ORDER_STATUS_CURRENT)
+        self.assertGreater(ask.expiration_date, datetime.now() + timedelta(days=2))
+        self.assertEqual(MarketSummary.objects.get(product_size=self.product_size).lowest_ask, Decimal('200.00'))
+
+    def test_engine_matches_instant_orders_against_best_counter_order(self):
+        submit(BUY, self.buyer, self.product_size, '150.00', self.shipping, expiration_days='3')
+        submit(BUY, self.buyer, self.product_size, '180.00', self.shipping, expiration_days='3')
+
+        ask, trade = submit(SELL, self.seller, self.product_size, '170.00', self.shipping, instant=True, total_price='160.00')
+
+        self.assertEqual(trade.ask, ask)
+        self.assertEqual((ask.price, ask.total_price), (Decimal('180.00'), Decimal('170.00')))
+        self.assertEqual(trade.bid.price, Decimal('180.00'))
+        self.assertEqual(trade.bid.order_status.name, ORDER_STATUS_PENDING)
+        self.assertTrue(ask.order_number.startswith('A'))
+        self.assertTrue(Bid.objects.get(id=trade.bid_id).order_number.startswith('B'))
+        self.assertEqual(ShippingInformation.objects.filter(user=self.buyer).count(), 1)
+
+    def test_engine_rejects_instant_orders_beyond_the_quoted_price(self):
+        ask, no_trade = submit(SELL, self.seller, self.product_size, '500.00', self.shipping, expiration_days='3')
+
+        with self.assertRaises(OrderError) as context:
+            submit(BUY, self.buyer, self.product_size, '120.00', self.shipping, instant=True, total_price='125.00')
+
+        ask.refresh_from_db()
+
+        self.assertEqual(context.exception.message, 'ASK_DOES_NOT_EXIST')
+        self.assertEqual((ask.order_status.name, ask.total_price), (ORDER_STATUS_CURRENT, None))
+        self.assertFalse(Bid.objects.exists())
+
+    def test_engine_rejects_invalid_orders_without_writing(self):
+        cases = [
+            ({'price': None, 'expiration_days': '3'}, 'KEY_ERROR'),
+            ({'price': 'abc', 'expiration_days': '3'}, 'INVALID_VALUE'),
+            ({'price': '100.00', 'expiration_days': None}, 'KEY_ERROR'),
+            ({'price': '100.00', 'instant': True}, 'KEY_ERROR'),
+            ({'price': '100.00', 'instant': True, 'total_price': '110.00'}, 'ASK_DOES_NOT_EXIST'),
+        ]
+
+        for arguments, message in cases:
+            with self.assertRaises(OrderError) as context:
+                submit(BUY, self.buyer, self.product_size, shipping=self.shipping, **arguments)
+
+            self.assertEqual(context.exception.message, message)
+
+        self.assertFalse(Bid.objects.exists())
+        self.assertFalse(ShippingInformation.objects.exists())
+
+    def test_engine_crosses_resting_orders_that_meet_the_opposite_side(self):
+        submit(SELL, self.seller, self.product_size, '200.00', self.shipping, expiration_days='3')
+        submit(SELL, self.seller, self.product_size, '180.00', self.shipping, expiration_days='3')
+
+        resting, no_trade = submit(BUY, self.buyer, self.product_size, '170.00', self.shipping, expiration_days='3')
+        bid, trade        = submit(BUY, self.buyer, self.product_size, '190.00', self.shipping, expiration_days='3')
+
+        self.assertIsNone(no_trade)
+        self.assertEqual(resting.order_status.name, ORDER_STATUS_CURRENT)
+        self.assertEqual(trade.bid, bid)
+        self.assertEqual(trade.ask.price, Decimal('180.00'))
+        self.assertEqual((bid.price, bid.total_price), (Decimal('180.00'), Decimal('180.00')))
+        self.assertEqual(Ask.objects.get(id=trade.ask_id).total_price, Decimal('180.00'))
+        self.assertEqual(bid.order_status.name, ORDER_STATUS_PENDING)
+        self.assertEqual(MarketSummary.objects.get(product_size=self.product_size).lowest_ask, Decimal('200.00'))
+
+    @override_settings(ORDER_BOOK_ENABLED=True)
+    def test_engine_crosses_against_the_order_book(self):
+        order_books.clear()
+
+        try:
+            submit(BUY, self.buyer, self.product_size, '150.00', self.shipping, expiration_days='3')
+            run_commit_hooks()
+
+            resting, no_trade = submit(SELL, self.seller, self.product_size, '160.00', self.shipping, expiration_days='3')
+            ask, trade        = submit(SELL, self.seller, self.product_size, '150.00', self.shipping, expiration_days='3')
+
+            run_commit_hooks()
+
+            self.assertIsNone(no_trade)
+            self.assertEqual(trade.ask, ask)
+            self.assertEqual(order_books.check(), [])
+            self.assertEqual(order_books.best_bid(self.product_size.id), None)
+        finally:
+            order_books.clear()
+
+    @override_settings(ORDER_BOOK_ENABLED=True)
+    def test_engine_falls_back_to_the_table_when_the_order_book_misses(self):
+        order_books.clear()
+
+        try:
+            order_books.load([self.product_size.id])
+
+            # bulk_create sends no signals, like an ask written by another worker process
+            Ask.objects.bulk_create([Ask(
+                user                 = self.seller,
+                product_size         = self.product_size,
+                price                = 100,
+                order_status         = order_statuses.get(ORDER_STATUS_CURRENT),
+                shipping_information = ShippingInformation.objects.create(user=self.seller, **self.shipping)
+            )])
+
+            bid, trade = submit(BUY, self.buyer, self.product_size, '150.00', self.shipping, instant=True, total_price='155.00')
+            resting, no_trade = submit(BUY, self.buyer, self.product_size, '150.00', self.shipping, expiration_days='3')
+
+            self.assertEqual(trade.bid, bid)
+            self.assertEqual(bid.price, Decimal('100.00'))
+            self.assertIsNone(no_trade)
+            self.assertEqual(resting.order_status.name, ORDER_STATUS_CURRENT)
+        finally:
+            order_books.clear()
+
+@override_settings(ORDER_NUMBER_BLOCK_SIZE=3)
+class OrderNumberTest(TestCase):
+    def setUp(self):
+        order_numbers.clear()
+
+    def tearDown(self):
+        order_numbers.clear()
+
+    def test_order_numbers_are_allocated_from_reserved_blocks(self):
+        numbers = [order_numbers.allocate('A')]
+
+        with self.assertNumQueries(0):
+            numbers += [order_numbers.allocate('A') for _ in range(2)]
+
+        numbers += [order_numbers.allocate('B') for _ in range(2)]
+        today    = datetime.now().strftime('%y%m%d')
+
+        self.assertEqual(numbers[0], f'A{today}00001')
+        self.assertEqual(numbers[-1], f'B{today}00005')
+        self.assertEqual(len({number[1:] for number in numbers}), 5)
+        self.assertEqual(OrderNumberSequence.objects.get().last_value, 6)
+
+    def test_order_number_block_is_dropped_when_its_reservation_rolls_back(self):
+        with transaction.atomic():
+            order_numbers.allocate('A')
+            transaction.set_rollback(True)
+
+        self.assertFalse(OrderNumberSequence.objects.exists())
+
+        order_numbers.allocate('A')
+
+        self.assertEqual(OrderNumberSequence.objects.get().last_value, 3)
+
+@override_settings(ORDER_NUMBER_BLOCK_SIZE=3)
+class DetachedOrderNumberTest(TransactionTestCase):
+    def setUp(self):
+        order_numbers.clear()
+
+    def tearDown(self):
+        order_numbers.clear()
+
+    def test_order_number_block_is_reserved_outside_the_order_transaction(self):
+        today = datetime.now().strftime('%y%m%d')
+
+        with patch.object(connection.features, 'has_select_for_update', True):
+            with transaction.atomic():
+                number = order_numbers.allocate('A')
+                transaction.set_rollback(True)
+
+        self.assertEqual(number, f'A{today}00001')
+        self.assertEqual(OrderNumberSequence.objects.get().last_value, 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(order_numbers.allocate('B'), f'B{today}00002')
+
+class BulkOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        buyer      = User.objects.create(email='buyer@wecode.com', name='buyer')
+        cls.seller = User.objects.create(email='seller@wecode.com', name='seller')
+        cls.product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.sizes         = [Size.objects.create(name=str(230 + index * 5)) for index in range(20)]
+        cls.product_sizes = [ProductSize.objects.create(product=cls.product, size=size) for size in cls.sizes]
+        OrderStatus.objects.create(name=ORDER_STATUS_CURRENT)
+        OrderStatus.objects.create(name=ORDER_STATUS_PENDING)
+
+        cls.shipping = {
+            "name"           : "bongbong",
+            "country"        : "InSideOut",
+            "primaryAddress" : "bongbong_station",
+            "city"           : "dream",
+            "postalCode"     : "123456",
+            "phoneNumber"    : "01012341234",
+        }
+
+        Bid.objects.create(
+            user                 = buyer,
+            product_size         = cls.product_sizes[1],
+            price                = 200.00,
+            order_status         = order_statuses.get(ORDER_STATUS_CURRENT),
+            shipping_information = ShippingInformation.objects.create(
+                user            = buyer,
+                name            = 'buyer',
+                country         = 'buyer',
+                primary_address = 'buyer',
+                city            = 'buyer',
+                postal_code     = 'buyer',
+                phone_number    = 'buyer'
+            )
+        )
+
+        cls.token = jwt.encode({'email':cls.seller.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def post(self, orders, shipping=None):
+        return client.post('/order/sell/bulk', json.dumps(dict(shipping or self.shipping, orders=orders)),\
+                content_type='application/json', HTTP_Authorization=self.token)
+
+    def test_bulk_sell_returns_result_per_item(self):
+        response = self.post([
+            {'productId': self.product.id, 'size': self.sizes[0].id, 'price': '150.00', 'expirationDate': '30'},
+            {'productId': self.product.id, 'size': self.sizes[1].id, 'price': '190.00', 'expirationDate': '30'},
+            {'productId': self.product.id, 'size': self.sizes[2].id, 'price': 'abc', 'expirationDate': '30'},
+            {'productId': self.product.id, 'size': 999, 'price': '150.00', 'expirationDate': '30'},
+            {'productId': self.product.id, 'size': self.sizes[3].id, 'price': '150.00'},
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['results'], [
+            {'message':'SUCCESS'},
+            {'message':'MATCHED'},
+            {'message':'INVALID_VALUE'},
+            {'message':'PRODUCT_SIZE_DOES_NOT_EXIST'},
+            {'message':'KEY_ERROR'},
+        ])
+        self.assertEqual(Ask.objects.filter(order_status__name=ORDER_STATUS_CURRENT).count(), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ShippingInformation.objects.filter(user=self.seller).count(), 1)
+        self.assertEqual(MarketSummary.objects.get(product_size=self.product_sizes[0]).lowest_ask, Decimal('150.00'))
+
+    def test_bulk_sell_query_count_does_not_grow_with_orders(self):
+        orders = [
+            {'productId': self.product.id, 'size': size.id, 'price': '300.00', 'expirationDate': '30'}
+            for size in self.sizes
+        ]
+
+        self.post(orders[:1])
+
+        with self.assertNumQueries(12):
+            response = self.post(orders[:2])
+
+        with self.assertNumQueries(12):
+            response = self.post(orders)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Ask.objects.count(), 23)
+
+    def test_bulk_sell_rejects_missing_shipping_information(self):
+        response = self.post(
+            [{'productId': self.product.id, 'size': self.sizes[0].id, 'price': '150.00', 'expirationDate': '30'}],
+            shipping = {'name':'bongbong'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'KEY_ERROR'})
+        self.assertFalse(Ask.objects.exists())
+
+class ExpirationSweeperTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user    = User.objects.create(email='shockx@wecode.com', name='shocking')
+        product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.product_size     = ProductSize.objects.create(product=product, size=Size.objects.create(name='1'))
+        order_status         = OrderStatus.objects.create(name=ORDER_STATUS_CURRENT)
+        shipping_information = ShippingInformation.objects.create(
+            user            = user,
+            name            = 'bongbong',
+            country         = 'InSideOut',
+            primary_address = 'bongbong_station',
+            city            = 'dream',
+            postal_code     = '123456',
+            phone_number    = '01012341234'
+        )
+
+        for model, prices in [(Ask, [100, 110, 120, 130, 140]), (Bid, [90, 80])]:
+            for index, price in enumerate(prices):
+                model.objects.create(
+                    user                 = user,
+                    product_size         = cls.product_size,
+                    price                = price,
+                    expiration_date      = datetime.now() + timedelta(days=-1 if index < len(prices) - 1 else 1),
+                    order_status         = order_status,
+                    shipping_information = shipping_information
+                )
+
+    def test_sweeper_expires_orders_in_bounded_batches(self):
+        before    = expiration_sweeper.metrics()['processed']
+        processed = expiration_sweeper.sweep(batch_size=2, max_batches=1)
+
+        self.assertEqual(processed, {'asks': 2, 'bids': 1})
+        self.assertEqual(list(Ask.objects.filter(order_status__name='expired').values_list('price', flat=True)\
+                .order_by('price')), [Decimal('100.00'), Decimal('110.00')])
+
+        processed = expiration_sweeper.sweep(batch_size=2)
+
+        self.assertEqual(processed, {'asks': 2, 'bids': 0})
+        self.assertEqual(Ask.objects.filter(order_status__name=ORDER_STATUS_CURRENT).get().price, Decimal('140.00'))
+        self.assertEqual(Bid.objects.filter(order_status__name=ORDER_STATUS_CURRENT).get().price, Decimal('80.00'))
+        self.assertEqual(expiration_sweeper.metrics()['processed'], {'asks': before['asks'] + 4, 'bids': before['bids'] + 1})
+
+        summary = MarketSummary.objects.get(product_size=self.product_size)
+
+        self.assertEqual((summary.lowest_ask, summary.highest_bid), (Decimal('140.00'), Decimal('80.00')))
+
+    def test_sweeper_resolves_the_seeded_expired_status_without_writing_it(self):
+        order_statuses.all()
+
+        with self.assertNumQueries(0):
+            expiration_sweeper.sweep(max_batches=0)
+
+        self.assertEqual(OrderStatus.objects.filter(name='expired').count(), 1)
+
+    def test_sweep_changes_product_etag(self):
+        url  = f'/product/{self.product_size.product_id}'
+        etag = client.get(url)['ETag']
+
+        expiration_sweeper.sweep()
+        run_commit_hooks()
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_sweep_expired_orders_command_reports_processed_orders(self):
+        out = StringIO()
+
+        call_command('sweep_expired_orders', '--batch-size', '3', stdout=out)
+
+        self.assertIn('expired_orders_processed{side="asks"} 4', out.getvalue())
+        self.assertIn('expired_orders_processed{side="bids"} 1', out.getvalue())
+
+class AccountOrdersQueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user    = User.objects.create(email='shockx@wecode.com', name='shocking')
+        product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        Image.objects.create(image_url='a.jpg', product=product)
+        Image.objects.create(image_url='b.jpg', product=product)
+
+        product_sizes        = [ProductSize.objects.create(product=product, size=Size.objects.create(name=str(index)))
+                for index in range(10)]
+        current              = OrderStatus.objects.create(name=ORDER_STATUS_CURRENT)
+        pending              = OrderStatus.objects.create(name=ORDER_STATUS_PENDING)
+        shipping_information = ShippingInformation.objects.create(
+            user            = user,
+            name            = 'bongbong',
+            country         = 'InSideOut',
+            primary_address = 'bongbong_station',
+            city            = 'dream',
+            postal_code     = '123456',
+            phone_number    = '01012341234'
+        )
+
+        for model in [Ask, Bid]:
+            model.objects.bulk_create([model(
+                user                 = user,
+                product_size         = product_sizes[index % 10],
+                price                = 100 + index,
+                expiration_date      = datetime.now() + timedelta(days=30),
+                order_status         = current,
+                shipping_information = shipping_information
+            ) for index in range(500)] + [model(
+                user                 = user,
+                product_size         = product_sizes[index % 10],
+                price                = 100 + index,
+                matched_at           = datetime.now(),
+                order_number         = f'{model.__name__[0]}{index:05}',
+                order_status         = pending,
+                shipping_information = shipping_information
+            ) for index in range(50)])
+
+        cls.token = jwt.encode({'email':user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def test_account_buying_query_count_is_constant(self):
+        client.get('/order/account/buying', HTTP_Authorization=self.token)
+
+        with self.assertNumQueries(2):
+            response = client.get('/order/account/buying', HTTP_Authorization=self.token)
+
+        buying = response.json()['buying']
+
+        self.assertEqual((len(buying['current']), len(buying['pending'])), (20, 20))
+        self.assertEqual(buying['current'][0], {
+            'name'       : 'Yordan',
+            'size'       : '9',
+            'image'      : 'a.jpg',
+            'bidPrice'   : 599,
+            'highestBid' : 599,
+            'lowestAsk'  : 109,
+            'expires'    : (datetime.now() + timedelta(days=30)).strftime('%Y/%m/%d')
+        })
+        self.assertIsNotNone(buying['nextCursor']['current'])
+
+    def test_account_buying_section_is_paginated_with_cursor(self):
+        client.get('/order/account/buying', HTTP_Authorization=self.token)
+
+        prices = []
+        cursor = ''
+
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                response = client.get(f'/order/account/buying?section=current&limit=100&cursor={cursor}',\
+                        HTTP_Authorization=self.token)
+
+            buying  = response.json()['buying']
+            prices += [bid['bidPrice'] for bid in buying['current']]
+            cursor  = buying['nextCursor']['current']
+
+            self.assertNotIn('pending', buying)
+
+        self.assertEqual(prices, list(range(599, 99, -1)))
+
+    def test_account_buying_filters_by_product_and_date(self):
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        today    = datetime.now().strftime('%Y-%m-%d')
+
+        response = client.get(f'/order/account/buying?section=pending&startDate={today}&endDate={today}',\
+                HTTP_Authorization=self.token)
+        self.assertEqual(len(response.json()['buying']['pending']), 20)
+
+        response = client.get(f'/order/account/buying?startDate={tomorrow}', HTTP_Authorization=self.token)
+        self.assertEqual((response.json()['buying']['current'], response.json()['buying']['pending']), ([], []))
+
+        response = client.get('/order/account/buying?productId=999', HTTP_Authorization=self.token)
+        self.assertEqual(response.json()['buying']['current'], [])
+
+        response = client.get('/order/account/buying?startDate=yesterday', HTTP_Authorization=self.token)
+        self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+        for limit in ['-1', '0']:
+            response = client.get(f'/order/account/buying?section=current&limit={limit}', HTTP_Authorization=self.token)
+            self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+        response = client.get('/order/account/buying?section=current&cursor=abc', HTTP_Authorization=self.token)
+        self.assertEqual(response.json(), {'message':'INVALID_CURSOR'})
+
+    def test_account_selling_query_count_is_constant(self):
+        client.get('/order/account/selling', HTTP_Authorization=self.token)
+
+        with self.assertNumQueries(2):
+            response = client.get('/order/account/selling', HTTP_Authorization=self.token)
+
+        selling = response.json()['selling']
+
+        self.assertEqual((len(selling['current']), len(selling['pending'])), (20, 20))
+        self.assertEqual(selling['username'], 'shocking')
+
+@override_settings(ORDER_INTAKE_ASYNC=True)
+class OrderIntakeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        buyer   = User.objects.create(email='buyer@wecode.com', name='buyer')
+        seller  = User.objects.create(email='seller@wecode.com', name='seller')
+        product = Product.objects.create(
+            name          = 'Yordan',
+            model_number  = 'A1234',
+            ticker_number = 'AJ89',
+            color         = 'black',
+            description   = 'Gooood',
+            retail_price  = 300.00,
+            release_date  = '2020-11-10'
+        )
+        cls.size             = Size.objects.create(name='1')
+        cls.product_size     = ProductSize.objects.create(product=product, size=cls.size)
+        cls.url              = f'/order/buy/{product.id}?size={cls.size.id}'
+        shipping_information = ShippingInformation.objects.create(
+            user            = seller,
+            name            = 'seller',
+            country         = 'seller',
+            primary_address = 'seller',
+            city            = 'seller',
+            postal_code     = 'seller',
+            phone_number    = 'seller'
+        )
+        Ask.objects.create(
+            user                 = seller,
+            product_size         = cls.product_size,
+            price                = 200.00,
+            order_status         = OrderStatus.objects.create(name=ORDER_STATUS_CURRENT),
+            shipping_information = shipping_information
+        )
+        OrderStatus.objects.create(name=ORDER_STATUS_PENDING)
+
+        cls.token        = jwt.encode({'email':buyer.email}, SECRET_KEY, algorithm=ALGORITHM)
+        cls.seller_token = jwt.encode({'email':seller.email}, SECRET_KEY, algorithm=ALGORITHM)
+        cls.data         = {
+            "isBid"          : "0",
+            "price"          : "200.00",
+            "name"           : "bongbong",
+            "country"        : "InSideOut",
+            "primaryAddress" : "bongbong_station",
+            "city"           : "dream",
+            "postalCode"     : "123456",
+            "phoneNumber"    : "01012341234",
+            "totalPrice"     : "210.00"
+        }
+
+    def post(self, data):
+        return client.post(self.url, json.dumps(data), content_type='application/json', HTTP_Authorization=self.token)
+
+    def status(self, handle, token=None):
+        return client.get(f'/order/intake/{handle}', HTTP_Authorization=token or self.token)
+
+    def test_intake_accepts_and_matches_in_submission_order(self):
+        first  = self.post(self.data)
+        second = self.post(self.data)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(self.status(first.json()['handle']).json()['intake']['status'], 'queued')
+        self.assertFalse(Bid.objects.exists())
+
+        self.assertEqual(process_pending(), 2)
+
+        first  = self.status(first.json()['handle']).json()['intake']
+        second = self.status(second.json()['handle']).json()['intake']
+
+        self.assertEqual((first['status'], first['message']), ('accepted', 'MATCHED'))
+        self.assertTrue(first['orderNumber'].startswith('B'))
+        self.assertEqual((second['status'], second['message']), ('rejected', 'ASK_DOES_NOT_EXIST'))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(process_pending(), 0)
+
+    @override_settings(ORDER_INTAKE_MAX_ATTEMPTS=2)
+    def test_intake_retries_unexpected_errors_then_fails(self):
+        first  = self.post(self.data).json()['handle']
+        second = self.post(self.data).json()['handle']
+        submit = engine.submit
+
+        def flaky_submit(side, user, product_size, price, *args, **kwargs):
+            if OrderIntake.objects.filter(handle=first, status='queued').exists() and not Bid.objects.exists():
+                raise OperationalError('deadlock detected')
+
+            return submit(side, user, product_size, price, *args, **kwargs)
+
+        with patch('order.engine.submit', side_effect=flaky_submit), self.assertLogs('order.intake', 'ERROR'):
+            self.assertEqual(process_pending(batch_size=1), 2)
+
+        first  = OrderIntake.objects.get(handle=first)
+        second = OrderIntake.objects.get(handle=second)
+
+        self.assertEqual((first.status, first.message, first.attempts), ('failed', 'INTERNAL_ERROR', 2))
+        self.assertEqual((second.status, second.message), ('accepted', 'MATCHED'))
+        self.assertEqual(self.status(first.handle).json()['intake']['status'], 'failed')
+
+    def test_intake_keeps_later_orders_behind_a_retry(self):
+        first  = self.post(self.data).json()['handle']
+        second = self.post(self.data).json()['handle']
+        submit = engine.submit
+
+        def flaky_submit(side, user, product_size, price, *args, **kwargs):
+            if not OrderIntake.objects.filter(handle=first, attempts__gt=0).exists():
+                raise OperationalError('deadlock detected')
+
+            return submit(side, user, product_size, price, *args, **kwargs)
+
+        with patch('order.engine.submit', side_effect=flaky_submit), self.assertLogs('order.intake', 'ERROR'):
+            self.assertEqual(process_pending(), 0)
+
+        self.assertEqual(list(OrderIntake.objects.order_by('id').values_list('status', flat=True)), ['queued', 'queued'])
+
+        with patch('order.engine.submit', side_effect=flaky_submit):
+            self.assertEqual(process_pending(), 2)
+
+        first  = OrderIntake.objects.get(handle=first)
+        second = OrderIntake.objects.get(handle=second)
+
+        self.assertEqual((first.status, first.message, first.attempts), ('accepted', 'MATCHED', 1))
+        self.assertEqual((second.status, second.message), ('rejected', 'ASK_DOES_NOT_EXIST'))
+
+    def test_intake_rejects_invalid_orders_synchronously(self):
+        response = self.post(dict(self.data, totalPrice=None))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'KEY_ERROR'})
+        self.assertFalse(OrderIntake.objects.exists())
+
+    def test_intake_status_is_private_to_its_owner(self):
+        handle = self.post(self.data).json()['handle']
+
+        self.assertEqual(self.status(handle, self.seller_token).status_code, 404)
+
+    def test_run_order_intake_command_processes_queue(self):
+        self.post(self.data)
+
+        out = StringIO()
+        call_command('run_order_intake', '--once', stdout=out)
+
+        self.assertIn('Processed 1 queued orders', out.getvalue())
+        self.assertEqual(OrderIntake.objects.get().status, 'accepted')
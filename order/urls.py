@@ -1,10 +1,14 @@
 from django.urls import path, include
 
-from order.views import SellView, BuyView, BuyStatusView, SellStatusView
+from order.views  import SellView, BuyView, BulkOrderView, OrderIntakeView, BuyStatusView, SellStatusView
+from order.engine import BUY, SELL
 
 urlpatterns = [
     path('/buy/<int:product_id>', BuyView.as_view()),
     path('/sell/<int:product_id>', SellView.as_view()), 
+    path('/buy/bulk', BulkOrderView.as_view(side=BUY)),
+    path('/sell/bulk', BulkOrderView.as_view(side=SELL)),
+    path('/intake/<uuid:handle>', OrderIntakeView.as_view()),
     path('/account/buying', BuyStatusView.as_view()),
     path('/account/selling', SellStatusView.as_view()),
     ]
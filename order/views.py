@@ -1,18 +1,54 @@
 import json
 from datetime import datetime, timedelta
 
-from django.http  import JsonResponse
-from django.views import View
-from django.db    import transaction
-
-from user.models    import User, ShippingInformation
-from product.models import ProductSize, Product, Size, Image
-from order.models   import Ask, Bid, OrderStatus, Order
-from utils          import login_decorator
-
-ORDER_STATUS_CURRENT = 'current'
-ORDER_STATUS_PENDING = 'pending'
-ORDER_NUMBER_LENGTH  = 5
+from django.http      import JsonResponse
+from django.views     import View
+from django.db.models import Q, OuterRef, Subquery
+
+from user.models    import ShippingInformation
+from product.models import ProductSize, Product, Image
+from order.models   import Ask, Bid, MarketSummary, OrderIntake, order_status_id
+from order          import engine, intake
+from utils          import login_decorator, encode_cursor, decode_cursor, page_limit
+
+ORDER_STATUS_CURRENT  = 'current'
+ORDER_STATUS_PENDING  = 'pending'
+ACCOUNT_PAGE_SIZE     = 20
+ACCOUNT_PAGE_SIZE_MAX = 100
+
+def shipping_from_request(data):
+    return {
+        'name'              : data.get('name'),
+        'country'           : data.get('country'),
+        'primary_address'   : data.get('primaryAddress'),
+        'secondary_address' : data.get('secondaryAddress'),
+        'city'              : data.get('city'),
+        'state'             : data.get('state'),
+        'postal_code'       : data.get('postalCode'),
+        'phone_number'      : data.get('phoneNumber'),
+    }
+
+def place_order(side, request, product_size, data, instant):
+    submit = intake.enqueue if intake.intake_enabled() else engine.submit
+
+    try:
+        result = submit(
+            side,
+            request.user,
+            product_size,
+            data.get('price'),
+            shipping_from_request(data),
+            instant         = instant,
+            expiration_days = data.get('expirationDate'),
+            total_price     = data.get('totalPrice')
+        )
+    except engine.OrderError as error:
+        return JsonResponse({'message':error.message}, status=error.status)
+
+    if intake.intake_enabled():
+        return JsonResponse({'message':'ACCEPTED', 'handle':str(result.handle)}, status=202)
+
+    return JsonResponse({'message':'SUCCESS'}, status=201)
 
 class BuyView(View):
     @login_decorator
@@ -25,20 +61,19 @@ class BuyView(View):
 
         ProductSize.objects.select_related('product', 'size').prefetch_related('ask_set', 'bid_set', 'product__image_set')
         
-        product_size = ProductSize.objects.get(product_id=product_id, size_id=size_id)
-        highest_bid  = product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('-price').first()
-        lowest_ask   = product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('price').first()
+        product_size   = ProductSize.objects.get(product_id=product_id, size_id=size_id)
+        market_summary = MarketSummary.objects.for_product_size(product_size.id)
 
         product_detail = {
             'id'         : product_size.id,
             'name'       : product_size.product.name,
-            'highestBid' : highest_bid.price if highest_bid else 0,
-            'lowestAsk'  : lowest_ask.price if lowest_ask else 0,
+            'highestBid' : market_summary.highest_bid or 0,
+            'lowestAsk'  : market_summary.lowest_ask or 0,
             'size'       : product_size.size.name,
             'image'      : product_size.product.image_set.first().image_url,
         }
 
-        shipping_information = ShippingInformation.objects.filter(user=user).last()
+        shipping_information = ShippingInformation.objects.filter(user_id=user.id).last()
         shipping_information_detail = {
             'name'             : shipping_information.name if shipping_information else None,
             'country'          : shipping_information.country if shipping_information else None,
@@ -54,103 +89,22 @@ class BuyView(View):
     
     @login_decorator
     def post(self, request, product_id):
-        try:
-            data    = json.loads(request.body)
-            user    = request.user
-            size_id = request.GET.get('size', None)
-
-            if not ProductSize.objects.filter(product_id=product_id, size_id=size_id).exists():
-                return JsonResponse({'message':'PRODUCT_SIZE_DOES_NOT_EXIST'}, status=404)
-
-            is_bid            = data.get('isBid', None)
-            price             = data.get('price', None)
-            name              = data.get('name', None)
-            country           = data.get('country', None)
-            primary_address   = data.get('primaryAddress', None)
-            secondary_address = data.get('secondaryAddress', None)
-            city              = data.get('city', None)
-            state             = data.get('state', None)
-            postal_code       = data.get('postalCode', None)
-            phone_number      = data.get('phoneNumber', None)
-            expiration_date   = data.get('expirationDate', None)
-            total_price       = data.get('totalPrice', None)
-
-            if not is_bid:
-                return JsonResponse({'message':'KEY_ERROR'}, status=400)
-            
-            if not (is_bid == '1' or is_bid == '0'):
-                return JsonResponse({'message':'INVALID_VALUE'}, status=400)
-            
-            if not (name and country and primary_address and city and postal_code and phone_number and price):
-                return JsonResponse({'message':'KEY_ERROR'}, status=400)
-
-            product_size = ProductSize.objects.get(product_id=product_id, size_id=size_id)
-            with transaction.atomic():
-                shipping_information, created = ShippingInformation.objects.get_or_create(
-                    user              = user,
-                    name              = name,
-                    country           = country,
-                    primary_address   = primary_address,
-                    secondary_address = secondary_address,
-                    city              = city,
-                    state             = state,
-                    postal_code       = postal_code,
-                    phone_number      = phone_number
-                )
-
-                order_status_current = OrderStatus.objects.get(name=ORDER_STATUS_CURRENT)
-                order_status_pending = OrderStatus.objects.get(name=ORDER_STATUS_PENDING)
-                
-                if bool(int(is_bid)):
-                    if not expiration_date:
-                        raise KeyError
-                    
-                    Bid.objects.create(
-                        user                 = user,
-                        product_size         = product_size,
-                        price                = price,
-                        expiration_date      = datetime.now() + timedelta(days=int(expiration_date)),
-                        order_status         = order_status_current,
-                        shipping_information = shipping_information
-                    )
-
-                    return JsonResponse({'message':'SUCCESS'}, status=201)
-                
-                if not total_price:
-                    raise KeyError
-
-                bid = Bid.objects.create(
-                    user                 = user,
-                    product_size         = product_size,
-                    price                = price,
-                    order_status         = order_status_pending,
-                    matched_at           = datetime.now(),
-                    total_price          = total_price,
-                    shipping_information = shipping_information
-                )
-
-                bid.order_number = datetime.now().strftime('B' + '%y%m%d' + str(bid.id).zfill(ORDER_NUMBER_LENGTH))
-                bid.save()
-
-                if not product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).exists():
-                    raise ProductSize.DoesNotExist
-
-                lowest_ask  = product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('price').first()
-
-                lowest_ask.order_status = order_status_pending
-                lowest_ask.matched_at   = datetime.now()
-                lowest_ask.total_price  = total_price
-                lowest_ask.order_number = datetime.now().strftime('A' + '%y%m%d' + str(lowest_ask.id).zfill(ORDER_NUMBER_LENGTH))
-                lowest_ask.save()
-
-                Order.objects.create(bid=bid, ask=lowest_ask)
-                
-                return JsonResponse({'message':'SUCCESS'}, status=201)
-        
-        except KeyError:
+        data    = json.loads(request.body)
+        size_id = request.GET.get('size', None)
+        is_bid  = data.get('isBid', None)
+
+        product_size = ProductSize.objects.filter(product_id=product_id, size_id=size_id).first()
+
+        if not product_size:
+            return JsonResponse({'message':'PRODUCT_SIZE_DOES_NOT_EXIST'}, status=404)
+
+        if not is_bid:
             return JsonResponse({'message':'KEY_ERROR'}, status=400)
-        except ProductSize.DoesNotExist:
-            return JsonResponse({'message':'ASK_DOES_NOT_EXIST'}, status=404)
+
+        if not (is_bid == '1' or is_bid == '0'):
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        return place_order(engine.BUY, request, product_size, data, instant=is_bid == '0')
 
 class SellView(View):
     @login_decorator
@@ -162,17 +116,16 @@ class SellView(View):
             return JsonResponse({'message':'PRODUCT_SIZE_DOES_NOT_EXIST'}, status=404)
 
         product      = Product.objects.get(id = product_id)
-        size         = Size.objects.get(id = size_id)
-        product_size = ProductSize.objects.get(product_id = product_id, size_id= size)
-        image        = Image.objects.get(product_id = product_id)
-        highest_bid  = product_size.bid_set.filter(order_status__name = ORDER_STATUS_CURRENT).order_by('-price').first() 
-        lowest_ask   = product_size.ask_set.filter(order_status__name = ORDER_STATUS_CURRENT).order_by('price').first()
+        product_size = ProductSize.objects.select_related('size').get(product_id = product_id, size_id = size_id)
+        size         = product_size.size
+        image          = Image.objects.get(product_id = product_id)
+        market_summary = MarketSummary.objects.for_product_size(product_size.id)
 
         product_sell = {
                 'id'          : product_id,
                 'name'        : product.name,
-                'highestBid'  : highest_bid.price if highest_bid else 0,
-                'lowestAsk'   : lowest_ask.price if lowest_ask else 0,
+                'highestBid'  : market_summary.highest_bid or 0,
+                'lowestAsk'   : market_summary.lowest_ask or 0,
                 'size'        : size.name,
                 'image'       : image.image_url,
         }
@@ -196,162 +149,180 @@ class SellView(View):
 
     @login_decorator
     def post(self, request, product_id):
-        try: 
-            data        = json.loads(request.body)
-            user        = request.user
-            size_id     = request.GET.get('size')
-            is_ask      = data.get('isAsk', None)
-            price       = data.get('price', None)
-            date        = data.get('expirationDate', None)
-            total_price = data.get('totalPrice', None)
-
-            if not ProductSize.objects.filter(product_id = product_id, size_id = size_id).exists():
-                return JsonResponse({'message':'PRODUCT_DOSE_NOT_EXISTS'}, status=404)
-
-            if not(is_ask == '0' or is_ask == '1'):
-                return JsonResponse({'message':'INVALID_VALUE'})
-
-            product              = Product.objects.get(id = product_id)
-            product_size         = ProductSize.objects.get(product_id = product_id, size_id = size_id)
-            highest_bid          = Bid.objects.filter(product_size = product_size, order_status__name =\
-                    ORDER_STATUS_CURRENT).order_by('-price').first()
-            order_status_pending = OrderStatus.objects.get(name = ORDER_STATUS_PENDING)
-            order_status_current = OrderStatus.objects.get(name = ORDER_STATUS_CURRENT)
-            date                 = datetime.now() - timedelta(days=int(date))
-
-            with transaction.atomic():
-                shippinginfo, created = ShippingInformation.objects.get_or_create(
-                        user_id           = user.id,
-                        name              = data['name'],
-                        country           = data['country'],
-                        primary_address   = data['primaryAddress'],
-                        secondary_address = data.get('secondaryAddress'),
-                        city              = data['city'],
-                        state             = data.get('state'),
-                        postal_code       = data['postalCode'],
-                        phone_number      = data['phoneNumber'],
-                )
-
-                if bool(int(is_ask)):
-                    if not date:
-                        raise KeyError 
-
-                    Ask.objects.create(
-                            user                 = user,
-                            product_size         = product_size,
-                            price                = price,
-                            expiration_date      = date,
-                            order_status         = order_status_current,
-                            shipping_information = shippinginfo,
-                    )
-
-                else:
-                    highest_bid.order_status    = OrderStatus.objects.get(name = ORDER_STATUS_PENDING)
-                    highest_bid.total_price     = total_price 
-                    highest_bid.order_number    = datetime.now().strftime('B%y%m%d' + str(highest_bid.id).zfill(5))
-                    highest_bid.matched_at      = datetime.now()
-                    highest_bid.save()
-
-                    ask = Ask.objects.create(
-                            user                 = user,
-                            product_size         = product_size,
-                            price                = price,
-                            order_status         = order_status_pending,
-                            total_price          = total_price,
-                            matched_at           = datetime.now(),
-                            shipping_information = shippinginfo,
-                            )
-
-                    ask.order_number = datetime.now().strftime('A%y%m%d' + str(ask.id).zfill(5))
-                    ask.save()
-
-                    Order.objects.create(
-                            bid = highest_bid,
-                            ask = ask,
-                            )
-
-                return JsonResponse({'message':'SUCCESS'}, status=201)
-
-        except KeyError:
-            return JsonResponse({'message':'KEY_ERROR'}, status=400)
+        data    = json.loads(request.body)
+        size_id = request.GET.get('size')
+        is_ask  = data.get('isAsk', None)
+
+        product_size = ProductSize.objects.filter(product_id=product_id, size_id=size_id).first()
+
+        if not product_size:
+            return JsonResponse({'message':'PRODUCT_DOSE_NOT_EXISTS'}, status=404)
+
+        if not (is_ask == '0' or is_ask == '1'):
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        return place_order(engine.SELL, request, product_size, data, instant=is_ask == '0')
 
-class BuyStatusView(View):
+class OrderIntakeView(View):
     @login_decorator
-    def get(self, request):
-        user = request.user
-
-        current_bids = Bid.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
-                .filter(user=user, order_status__name=ORDER_STATUS_CURRENT)\
-                .prefetch_related('product_size__product__image_set', 'product_size__bid_set', 'product_size__ask_set')
-
-        current_list = [{
-            'name'       : bid.product_size.product.name,
-            'size'       : bid.product_size.size.name,
-            'image'      : bid.product_size.product.image_set.first().image_url,
-            'bidPrice'   : int(bid.price),
-            'highestBid' : int(bid.product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('-price').all()[0].price)\
-                    if bid.product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-            'lowestAsk'  : int(bid.product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('price').all()[0].price)\
-                    if bid.product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-            'expires'    : bid.expiration_date.strftime('%Y/%m/%d')
-            } for bid in current_bids
-        ]
-
-        pending_bids = Bid.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
-                .filter(user=user, order_status__name=ORDER_STATUS_PENDING)\
-                .prefetch_related('product_size__product__image_set', 'product_size__bid_set', 'product_size__ask_set')
-
-        pending_list = [{
-            'name'         : bid.product_size.product.name,
-            'size'         : bid.product_size.size.name,
-            'image'        : bid.product_size.product.image_set.all()[0].image_url,
-            'price'        : int(bid.price),
-            "orderNumber"  : bid.order_number,
-            "purchaseDate" : bid.matched_at.strftime('%Y/%m/%d'),
-            } for bid in pending_bids
-        ]
-
-        username = User.objects.get(id=user.id).name
-
-        return JsonResponse({'buying':{'current':current_list, 'pending':pending_list, 'username':username}}, status=200)
-
-class SellStatusView(View):
+    def get(self, request, handle):
+        order_intake = OrderIntake.objects.select_related('ask', 'bid')\
+                .filter(handle=handle, user_id=request.user.id).first()
+
+        if not order_intake:
+            return JsonResponse({'message':'INTAKE_DOES_NOT_EXIST'}, status=404)
+
+        order = order_intake.bid or order_intake.ask
+
+        return JsonResponse({'intake': {
+            'handle'      : str(order_intake.handle),
+            'status'      : order_intake.status,
+            'message'     : order_intake.message,
+            'orderNumber' : order.order_number if order else None,
+            'createdAt'   : order_intake.created_at.isoformat(),
+            'processedAt' : order_intake.processed_at.isoformat() if order_intake.processed_at else None,
+        }}, status=200)
+
+class BulkOrderView(View):
+    side = None
+
+    @login_decorator
+    def post(self, request):
+        data   = json.loads(request.body)
+        orders = data.get('orders', None)
+
+        if not (isinstance(orders, list) and orders and all(isinstance(order, dict) for order in orders)):
+            return JsonResponse({'message':'KEY_ERROR'}, status=400)
+
+        items = [{
+            'product_id'      : order.get('productId'),
+            'size_id'         : order.get('size'),
+            'price'           : order.get('price'),
+            'expiration_days' : order.get('expirationDate'),
+        } for order in orders]
+
+        try:
+            results = engine.submit_bulk(self.side, request.user, shipping_from_request(data), items)
+        except engine.OrderError as error:
+            return JsonResponse({'message':error.message}, status=error.status)
+
+        if not any(result['message'] in ['SUCCESS', 'MATCHED'] for result in results):
+            return JsonResponse({'message':'INVALID_ORDERS', 'results':results}, status=400)
+
+        return JsonResponse({'message':'SUCCESS', 'results':results}, status=201)
+
+def account_orders(model, user, status, filters):
+    images = Image.objects.filter(product_id=OuterRef('product_size__product_id')).order_by('id')
+
+    return model.objects.select_related('product_size__product', 'product_size__size')\
+            .filter(user_id=user.id, order_status_id=order_status_id(status), **filters)\
+            .annotate(image_url=Subquery(images.values('image_url')[:1]))
+
+def with_best_prices(orders):
+    current_asks = Ask.objects.filter(product_size_id=OuterRef('product_size_id'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+    current_bids = Bid.objects.filter(product_size_id=OuterRef('product_size_id'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+
+    return orders.annotate(
+        highest_bid = Subquery(current_bids.order_by('-price').values('price')[:1]),
+        lowest_ask  = Subquery(current_asks.order_by('price').values('price')[:1])
+    )
+
+def account_filters(request):
+    product_id = request.GET.get('productId')
+    start_date = request.GET.get('startDate')
+    end_date   = request.GET.get('endDate')
+    filters    = {}
+
+    if product_id:
+        filters['product_size__product_id'] = int(product_id)
+
+    if start_date:
+        filters['created_at__gte'] = datetime.strptime(start_date, '%Y-%m-%d')
+
+    if end_date:
+        filters['created_at__lt'] = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+
+    return filters
+
+def account_page(orders, cursor, limit):
+    if cursor:
+        position   = decode_cursor(cursor)
+        created_at = datetime.fromisoformat(position['created_at'])
+        orders     = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=int(position['id'])))
+
+    orders = list(orders.order_by('-created_at', '-id')[:limit+1])
+
+    next_cursor = encode_cursor({'created_at': orders[limit-1].created_at.isoformat(), 'id': orders[limit-1].id}) \
+            if len(orders) > limit else None
+
+    return orders[:limit], next_cursor
+
+class AccountOrdersView(View):
+    model     = None
+    key       = None
+    price_key = None
+
+    def serialize_current(self, order):
+        return {
+            'name'         : order.product_size.product.name,
+            'size'         : order.product_size.size.name,
+            'image'        : order.image_url,
+            self.price_key : int(order.price),
+            'highestBid'   : int(order.highest_bid or 0),
+            'lowestAsk'    : int(order.lowest_ask or 0),
+            'expires'      : order.expiration_date.strftime('%Y/%m/%d')
+        }
+
+    def serialize_pending(self, order):
+        return {
+            'name'         : order.product_size.product.name,
+            'size'         : order.product_size.size.name,
+            'image'        : order.image_url,
+            'price'        : int(order.price),
+            "orderNumber"  : order.order_number,
+            "purchaseDate" : order.matched_at.strftime('%Y/%m/%d'),
+        }
+
     @login_decorator
     def get(self, request):
-        user = request.user
-        
-        current_asks = Ask.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
-                .filter(user=user, order_status__name=ORDER_STATUS_CURRENT)\
-                .prefetch_related('product_size__product__image_set', 'product_size__ask_set', 'product_size__bid_set')
-
-        current_list = [{
-            'name'       : ask.product_size.product.name,
-            'size'       : ask.product_size.size.name,
-            'image'      : ask.product_size.product.image_set.first().image_url,
-            'askPrice'   : int(ask.price),
-            'highestBid' : int(ask.product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('-price').first().price)\
-                    if ask.product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-            'lowestAsk'  : int(ask.product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('price').first().price)\
-                    if ask.product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-            'expires'    : ask.expiration_date.strftime('%Y/%m/%d')
-            } for ask in current_asks
-        ]
-
-        pending_asks = Ask.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
-                .filter(user=user, order_status__name=ORDER_STATUS_PENDING)\
-                .prefetch_related('product_size__product__image_set', 'product_size__ask_set', 'product_size__bid_set')
-
-        pending_list = [{
-            'name'         : ask.product_size.product.name,
-            'size'         : ask.product_size.size.name,
-            'image'        : ask.product_size.product.image_set.first().image_url,
-            'price'        : int(ask.price),
-            "orderNumber"  : ask.order_number,
-            "purchaseDate" : ask.matched_at.strftime('%Y/%m/%d'),
-            } for ask in pending_asks
-        ]
-
-        username = User.objects.get(id=user.id).name
-
-        return JsonResponse({'selling':{'current':current_list, 'pending':pending_list, 'username':username}}, status=200)
+        user    = request.user
+        section = request.GET.get('section')
+        cursor  = request.GET.get('cursor')
+
+        if section not in [None, ORDER_STATUS_CURRENT, ORDER_STATUS_PENDING] or (cursor and not section):
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        try:
+            limit   = page_limit(request.GET.get('limit'), ACCOUNT_PAGE_SIZE, ACCOUNT_PAGE_SIZE_MAX)
+            filters = account_filters(request)
+        except ValueError:
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        results = {'username':user.name, 'nextCursor':{}}
+
+        for status, serialize in [(ORDER_STATUS_CURRENT, self.serialize_current), (ORDER_STATUS_PENDING, self.serialize_pending)]:
+            if section and section != status:
+                continue
+
+            orders = account_orders(self.model, user, status, filters)
+            orders = with_best_prices(orders) if status == ORDER_STATUS_CURRENT else orders
+
+            try:
+                orders, next_cursor = account_page(orders, cursor, limit)
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse({'message':'INVALID_CURSOR'}, status=400)
+
+            results[status]               = [serialize(order) for order in orders]
+            results['nextCursor'][status] = next_cursor
+
+        return JsonResponse({self.key:results}, status=200)
+
+class BuyStatusView(AccountOrdersView):
+    model     = Bid
+    key       = 'buying'
+    price_key = 'bidPrice'
 
+class SellStatusView(AccountOrdersView):
+    model     = Ask
+    key       = 'selling'
+    price_key = 'askPrice'
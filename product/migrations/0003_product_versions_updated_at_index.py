@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_product_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productversion',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
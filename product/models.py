@@ -1,4 +1,10 @@
-from django.db import models
+import threading
+from datetime import datetime
+
+from django.db        import models
+from django.db.models import F, Max, signals
+
+from utils            import ReferenceRegistry, on_commit_hook
 
 class Product(models.Model):
     name          = models.CharField(max_length=200)
@@ -31,3 +37,80 @@ class ProductSize(models.Model):
 
     class Meta:
         db_table = 'product_sizes'
+
+sizes = ReferenceRegistry(Size)
+
+class ProductVersion(models.Model):
+    product_id = models.PositiveIntegerField(unique=True)
+    version    = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, db_index=True)
+
+    class Meta:
+        db_table = 'product_versions'
+
+class ProductVersionTracker:
+    def __init__(self):
+        self.local = threading.local()
+
+        for sender in ['order.Ask', 'order.Bid']:
+            signals.post_save.connect(self.touch_order, sender=sender, weak=False)
+            signals.post_delete.connect(self.touch_order, sender=sender, weak=False)
+
+        for sender in [Product, Image, Size, ProductSize]:
+            signals.post_save.connect(self.touch_catalog, sender=sender, weak=False)
+            signals.post_delete.connect(self.touch_catalog, sender=sender, weak=False)
+
+    def touch_order(self, instance, **kwargs):
+        self.touch(product_size_ids=[instance.product_size_id])
+
+    def touch_catalog(self, sender, instance, **kwargs):
+        if sender is Product:
+            self.touch(product_ids=[instance.id])
+        elif sender is Size:
+            self.touch(product_ids=ProductSize.objects.filter(size_id=instance.id).values_list('product_id', flat=True))
+        else:
+            self.touch(product_ids=[instance.product_id])
+
+    def touch(self, product_ids=(), product_size_ids=()):
+        hook   = getattr(self.local, 'hook', None)
+        queued = hook is not None and hook() is not None
+
+        # one bump per transaction, applied after commit; ids left by a rolled back transaction are dropped
+        if not queued:
+            self.local.pending = (set(), set())
+
+        self.local.pending[0].update(product_ids)
+        self.local.pending[1].update(product_size_ids)
+
+        if not queued:
+            self.local.hook = on_commit_hook(self.flush)
+
+    def flush(self):
+        product_ids, product_size_ids = self.local.pending
+        self.local.pending            = (set(), set())
+
+        if product_size_ids:
+            product_ids |= set(ProductSize.objects.filter(id__in=product_size_ids).values_list('product_id', flat=True))
+
+        if not product_ids:
+            return
+
+        product_ids = sorted(product_ids)
+        now         = datetime.now()
+        updated     = ProductVersion.objects.filter(product_id__in=product_ids).update(version=F('version') + 1, updated_at=now)
+
+        if updated < len(product_ids):
+            ProductVersion.objects.bulk_create([
+                ProductVersion(product_id=product_id, version=1, updated_at=now) for product_id in product_ids
+            ], ignore_conflicts=True)
+
+    def get(self, product_id=None):
+        if product_id:
+            return ProductVersion.objects.filter(product_id=product_id).first()
+
+        # the catalog changes whenever one of its products does, so it is as new as the latest product bump
+        updated_at = ProductVersion.objects.aggregate(updated_at=Max('updated_at'))['updated_at']
+
+        return ProductVersion(product_id=0, updated_at=updated_at) if updated_at else None
+
+product_versions = ProductVersionTracker()
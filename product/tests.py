@@ -1,15 +1,26 @@
 import json
+from datetime import datetime
 
 from django.views     import View
 from django.http      import JsonResponse
 from django.db.models import Q, Min, Avg
-from django.test      import TestCase, Client
+from django.test      import TestCase, Client, override_settings
+from django.core.cache import cache
+from django.db         import connection, transaction
+from django.utils.http import parse_http_date
+from unittest.mock     import patch
 
-from .models          import Product, Image, Size, ProductSize 
+from .models          import Product, Image, Size, ProductSize, ProductVersion
 from order.models     import Ask, Bid, OrderStatus, ExpirationType
 from user.models      import User, ShippingInformation
 
 client = Client()
+
+def run_commit_hooks():
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+
+    for sids, func in callbacks:
+        func()
 class ProductDetailTest(TestCase):
     def setUp(self):
         User.objects.create(
@@ -363,3 +374,452 @@ class ProductListTest(TestCase):
         client = Client()
         response = client.get('/products', {'limit':'20'})
         self.assertEqual(response.status_code, 404)
+
+class ProductListQueryCountTest(TestCase):
+    def setUp(self):
+        Size.objects.create(id=1, name='10')
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=1, name='current')
+
+    def create_products(self, start, count):
+        for product_id in range(start, start + count):
+            Product.objects.create(
+                id            = product_id,
+                name          = f'Jordan{product_id}',
+                model_number  = f'test{product_id}',
+                ticker_number = f'JT{product_id}',
+                color         = 'black',
+                description   = 'this is a test',
+                retail_price  = 100,
+                release_date  = '2020-02-14'
+            )
+            ProductSize.objects.create(id=product_id, product_id=product_id, size_id=1)
+            Image.objects.create(image_url=f'url{product_id}', product_id=product_id)
+            Image.objects.create(image_url=f'sub{product_id}', product_id=product_id)
+            Ask.objects.create(user_id=1, product_size_id=product_id, price=200 + product_id, order_status_id=1, shipping_information_id=1)
+            Ask.objects.create(user_id=1, product_size_id=product_id, price=100 + product_id, order_status_id=1, shipping_information_id=1)
+
+    def test_product_list_query_count_stays_flat(self):
+        client = Client()
+
+        self.create_products(1, 2)
+        client.get('/product')
+
+        with self.assertNumQueries(2):
+            response = client.get('/product', {'limit':'100'})
+        self.assertEqual(len(response.json()['products']), 2)
+
+        self.create_products(3, 20)
+        with self.assertNumQueries(2):
+            response = client.get('/product', {'limit':'100'})
+        self.assertEqual(len(response.json()['products']), 22)
+
+        with self.assertNumQueries(2):
+            response = client.get('/product', {'limit':'100', 'size':'1', 'lowest':'150'})
+
+        self.assertEqual(response.json()['products'][0],
+                {
+                    'productId'    : 1,
+                    'productName'  : 'Jordan1',
+                    'productImage' : 'url1',
+                    'price'        : 101,
+                    }
+                )
+        self.assertEqual(len(response.json()['products']), 22)
+
+class ProductListCursorTest(TestCase):
+    def setUp(self):
+        Size.objects.create(id=1, name='10')
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=1, name='current')
+
+        for product_id, price in [(1, 300), (2, 100), (3, 200), (4, 100), (5, None)]:
+            Product.objects.create(
+                id            = product_id,
+                name          = f'Jordan{product_id}',
+                model_number  = f'test{product_id}',
+                ticker_number = f'JT{product_id}',
+                color         = 'black',
+                description   = 'this is a test',
+                retail_price  = 100,
+                release_date  = '2020-02-14'
+            )
+            ProductSize.objects.create(id=product_id, product_id=product_id, size_id=1)
+            Image.objects.create(image_url=f'url{product_id}', product_id=product_id)
+            if price:
+                Ask.objects.create(user_id=1, product_size_id=product_id, price=price, order_status_id=1, shipping_information_id=1)
+
+    def fetch_all(self, params):
+        client      = Client()
+        product_ids = []
+        cursor      = ''
+
+        while cursor is not None:
+            response = client.get('/product', {**params, 'cursor':cursor})
+            self.assertEqual(response.status_code, 200)
+            product_ids += [product['productId'] for product in response.json()['products']]
+            cursor       = response.json()['nextCursor']
+
+        return product_ids
+
+    def test_product_list_cursor_by_id_success(self):
+        self.assertEqual(self.fetch_all({'limit':'2'}), [1, 2, 3, 4, 5])
+
+    def test_product_list_cursor_by_price_success(self):
+        self.assertEqual(self.fetch_all({'limit':'2', 'sort':'price'}), [5, 2, 4, 3, 1])
+
+    def test_product_list_cursor_page_query_count(self):
+        client = Client()
+        client.get('/product')
+
+        with self.assertNumQueries(2):
+            response = client.get('/product', {'limit':'2', 'cursor':''})
+
+        with self.assertNumQueries(2):
+            client.get('/product', {'limit':'2', 'cursor':response.json()['nextCursor']})
+
+    def test_product_list_offset_sort_by_price_success(self):
+        client   = Client()
+        response = client.get('/product', {'limit':'2', 'offset':'1', 'sort':'price'})
+
+        self.assertEqual([product['productId'] for product in response.json()['products']], [2, 4])
+        self.assertNotIn('nextCursor', response.json())
+
+    def test_product_list_rejects_invalid_limits(self):
+        client = Client()
+
+        for params in [{'limit':'-1'}, {'limit':'0'}, {'limit':'abc'}, {'limit':'-1', 'cursor':''}, {'offset':'-1'}]:
+            response = client.get('/product', params)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+    def test_product_list_caps_limit_in_offset_mode(self):
+        client = Client()
+
+        with patch('product.views.PRODUCT_PAGE_SIZE_MAX', 2):
+            response = client.get('/product', {'limit':'100', 'offset':'0'})
+
+        self.assertEqual(len(response.json()['products']), 2)
+
+    def test_product_list_invalid_cursor(self):
+        client   = Client()
+        response = client.get('/product', {'cursor':'invalid'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'INVALID_CURSOR'})
+
+    def test_product_list_invalid_sort(self):
+        client   = Client()
+        response = client.get('/product', {'sort':'name'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+class ProductDetailQueryCountTest(TestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=1, name='current')
+        OrderStatus.objects.create(id=3, name='history')
+        Product.objects.create(
+            id            = 1,
+            name          = 'Jordan',
+            model_number  = 'test101',
+            ticker_number = 'JT101',
+            color         = 'black',
+            description   = 'this is a test',
+            retail_price  = 100,
+            release_date  = '2020-02-14'
+        )
+        Image.objects.create(image_url='testurl', product_id=1)
+
+    def create_sizes(self, start, count):
+        for size_id in range(start, start + count):
+            Size.objects.create(id=size_id, name=str(size_id))
+            ProductSize.objects.create(id=size_id, product_id=1, size_id=size_id)
+            Ask.objects.create(user_id=1, product_size_id=size_id, price=300, order_status_id=1, shipping_information_id=1)
+            Bid.objects.create(user_id=1, product_size_id=size_id, price=90, order_status_id=1, shipping_information_id=1)
+            Ask.objects.create(user_id=1, product_size_id=size_id, price=120, matched_at='2021-01-01', order_status_id=3, shipping_information_id=1)
+            Ask.objects.create(user_id=1, product_size_id=size_id, price=150, matched_at='2021-02-01', order_status_id=3, shipping_information_id=1)
+
+    def test_product_detail_query_count_stays_flat(self):
+        self.create_sizes(1, 1)
+        client.get('/product/1')
+
+        with self.assertNumQueries(5):
+            response = client.get('/product/1')
+        self.assertEqual(len(response.json()['results']['sizes']), 1)
+
+        self.create_sizes(2, 19)
+        with self.assertNumQueries(5):
+            response = client.get('/product/1')
+        self.assertEqual(len(response.json()['results']['sizes']), 20)
+
+        size = response.json()['results']['sizes'][19]
+        self.assertEqual(size['size_id'], 20)
+        self.assertEqual(size['last_sale'], 150)
+        self.assertEqual(size['price_change'], 30)
+        self.assertEqual(size['lowest_ask'], 300)
+        self.assertEqual(size['highest_bid'], 90)
+        self.assertEqual(size['total_sales'], 2)
+        self.assertEqual(size['price_premium'], 50)
+        self.assertEqual(size['average_sale_price'], 135)
+        self.assertEqual([sale['sale_price'] for sale in size['sales_history']], [120, 150])
+
+    def test_product_detail_single_sale_success(self):
+        Size.objects.create(id=1, name='1')
+        ProductSize.objects.create(id=1, product_id=1, size_id=1)
+        Ask.objects.create(user_id=1, product_size_id=1, price=120, matched_at='2021-01-01', order_status_id=3, shipping_information_id=1)
+
+        response = client.get('/product/1')
+
+        self.assertEqual(response.json()['results']['sizes'][0]['last_sale'], 120)
+        self.assertEqual(response.json()['results']['sizes'][0]['price_change'], 0)
+        self.assertEqual(response.json()['results']['sizes'][0]['lowest_ask'], 0)
+
+class ProductSalesTest(TestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=3, name='history')
+        Product.objects.create(
+            id            = 1,
+            name          = 'Jordan',
+            model_number  = 'test101',
+            ticker_number = 'JT101',
+            color         = 'black',
+            description   = 'this is a test',
+            retail_price  = 100,
+            release_date  = '2020-02-14'
+        )
+        Size.objects.create(id=1, name='1')
+        Size.objects.create(id=2, name='2')
+        ProductSize.objects.create(id=1, product_id=1, size_id=1)
+        ProductSize.objects.create(id=2, product_id=1, size_id=2)
+
+        for day in range(1, 11):
+            Ask.objects.create(user_id=1, product_size_id=day % 2 + 1, price=100 + day, matched_at=f'2021-01-{day:02d}',
+                    order_status_id=3, shipping_information_id=1)
+
+    @override_settings(SALES_HISTORY_LIMIT=3)
+    def test_product_detail_sales_history_capped(self):
+        response = client.get('/product/1')
+
+        self.assertEqual([sale['sale_price'] for sale in response.json()['results']['sizes'][0]['sales_history']], [106, 108, 110])
+        self.assertEqual([sale['sale_price'] for sale in response.json()['results']['sizes'][1]['sales_history']], [105, 107, 109])
+        self.assertEqual(response.json()['results']['sizes'][0]['total_sales'], 5)
+
+    def test_product_sales_cursor_success(self):
+        prices = []
+        cursor = ''
+
+        while cursor is not None:
+            response = client.get('/product/1/sales', {'limit':'3', 'cursor':cursor})
+            self.assertEqual(response.status_code, 200)
+            prices += [sale['sale_price'] for sale in response.json()['sales']]
+            cursor  = response.json()['nextCursor']
+
+        self.assertEqual(prices, [110, 109, 108, 107, 106, 105, 104, 103, 102, 101])
+
+    def test_product_sales_size_filter_success(self):
+        response = client.get('/product/1/sales', {'size':'2'})
+
+        self.assertEqual([sale['sale_price'] for sale in response.json()['sales']], [109, 107, 105, 103, 101])
+        self.assertEqual(response.json()['sales'][0]['size_id'], 2)
+        self.assertIsNone(response.json()['nextCursor'])
+
+    def test_product_sales_invalid_cursor(self):
+        response = client.get('/product/1/sales', {'cursor':'invalid'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'INVALID_CURSOR'})
+
+    def test_product_sales_invalid_limit(self):
+        for limit in ['-1', '0', 'abc']:
+            response = client.get('/product/1/sales', {'limit':limit})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+    def test_product_sales_not_found(self):
+        response = client.get('/product/999/sales')
+
+        self.assertEqual(response.status_code, 404)
+
+class ProductCandleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=2, name='pending')
+        OrderStatus.objects.create(id=3, name='history')
+        Product.objects.create(
+            id            = 1,
+            name          = 'Jordan',
+            model_number  = 'test101',
+            ticker_number = 'JT101',
+            color         = 'black',
+            description   = 'this is a test',
+            retail_price  = 100,
+            release_date  = '2020-02-14'
+        )
+        Size.objects.create(id=1, name='1')
+        Size.objects.create(id=2, name='2')
+        ProductSize.objects.create(id=1, product_id=1, size_id=1)
+        ProductSize.objects.create(id=2, product_id=1, size_id=2)
+
+        for product_size_id, price, matched_at in [
+                (1, 100, '2021-03-01 10:00'), (1, 130, '2021-03-01 12:00'), (2, 90, '2021-03-01 15:00'),
+                (1, 110, '2021-03-03 09:00'), (2, 150, '2021-03-08 09:00'), (1, 120, '2021-04-02 09:00')]:
+            self.create_trade(product_size_id, price, matched_at)
+
+    def create_trade(self, product_size_id, price, matched_at):
+        Ask.objects.create(user_id=1, product_size_id=product_size_id, price=price, matched_at=matched_at,
+                order_status_id=3, shipping_information_id=1)
+
+    def test_product_candle_day_success(self):
+        response = client.get('/product/1/candles', {'interval':'1d'})
+
+        self.assertEqual(response.json()['candles'][0], {'time':'2021-03-01', 'open':100, 'high':130, 'low':90, 'close':90, 'volume':3})
+        self.assertEqual([candle['time'] for candle in response.json()['candles']], ['2021-03-01', '2021-03-03', '2021-03-08', '2021-04-02'])
+
+    def test_product_candle_week_size_success(self):
+        response = client.get('/product/1/candles', {'interval':'1w', 'size':'1'})
+
+        self.assertEqual(response.json()['candles'], [
+            {'time':'2021-03-01', 'open':100, 'high':130, 'low':100, 'close':110, 'volume':3},
+            {'time':'2021-03-29', 'open':120, 'high':120, 'low':120, 'close':120, 'volume':1},
+        ])
+
+    def test_product_candle_month_success(self):
+        response = client.get('/product/1/candles', {'interval':'1m'})
+
+        self.assertEqual(response.json()['candles'], [
+            {'time':'2021-03-01', 'open':100, 'high':150, 'low':90, 'close':150, 'volume':5},
+            {'time':'2021-04-01', 'open':120, 'high':120, 'low':120, 'close':120, 'volume':1},
+        ])
+
+    def test_product_candle_recomputes_open_bucket_only(self):
+        client.get('/product/1/candles', {'interval':'1d'})
+
+        self.create_trade(1, 999, '2021-03-01 20:00')
+        self.create_trade(1, 200, datetime.now().strftime('%Y-%m-%d %H:%M'))
+
+        with self.assertNumQueries(2):
+            response = client.get('/product/1/candles', {'interval':'1d'})
+
+        self.assertEqual(response.json()['candles'][0]['high'], 130)
+        self.assertEqual(response.json()['candles'][-1]['close'], 200)
+        self.assertEqual(response.json()['candles'][-1]['time'], datetime.now().strftime('%Y-%m-%d'))
+
+    def test_product_candle_invalid_interval(self):
+        response = client.get('/product/1/candles', {'interval':'1h'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+    def test_product_candle_invalid_size(self):
+        response = client.get('/product/1/candles', {'size':'abc'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'message':'INVALID_VALUE'})
+
+class ProductConditionalGetTest(TestCase):
+    def setUp(self):
+        User.objects.create(id=1, email='test@email', name='test')
+        ShippingInformation.objects.create(id=1, name='test', country='test', primary_address='test', city='test', state='test', postal_code='101', phone_number='010', user_id=1)
+        OrderStatus.objects.create(id=1, name='current')
+        Product.objects.create(
+            id            = 1,
+            name          = 'Jordan',
+            model_number  = 'test101',
+            ticker_number = 'JT101',
+            color         = 'black',
+            description   = 'this is a test',
+            retail_price  = 100,
+            release_date  = '2020-02-14'
+        )
+        Size.objects.create(id=1, name='1')
+        ProductSize.objects.create(id=1, product_id=1, size_id=1)
+        Image.objects.create(image_url='testurl', product_id=1)
+        self.ask = Ask.objects.create(user_id=1, product_size_id=1, price=300, order_status_id=1, shipping_information_id=1)
+        run_commit_hooks()
+
+    def test_product_detail_not_modified(self):
+        response = client.get('/product/1')
+        etag     = response['ETag']
+
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = client.get('/product/1', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_detail_modified_after_new_ask(self):
+        etag = client.get('/product/1')['ETag']
+
+        Ask.objects.create(user_id=1, product_size_id=1, price=250, order_status_id=1, shipping_information_id=1)
+        run_commit_hooks()
+
+        response = client.get('/product/1', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results']['sizes'][0]['lowest_ask'], 250)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_list_not_modified(self):
+        etag = client.get('/product', {'limit':'20'})['ETag']
+
+        response = client.get('/product', {'limit':'20'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.ask.delete()
+        run_commit_hooks()
+
+        response = client.get('/product', {'limit':'20'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_list_modified_after_catalog_change(self):
+        response = client.get('/product', {'limit':'20'})
+
+        Product.objects.create(name='Dunk', model_number='test102', ticker_number='DK102', color='white',
+            description='this is a test', retail_price=100, release_date='2020-02-14')
+        run_commit_hooks()
+
+        modified = client.get('/product', {'limit':'20'}, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(len(modified.json()['products']), 2)
+        self.assertGreaterEqual(parse_http_date(modified['Last-Modified']), parse_http_date(response['Last-Modified']))
+
+    def test_product_detail_ignores_other_products(self):
+        etag = client.get('/product/1')['ETag']
+
+        Product.objects.create(id=2, name='Dunk', model_number='test102', ticker_number='DK102', color='white',
+            description='this is a test', retail_price=100, release_date='2020-02-14')
+        run_commit_hooks()
+
+        self.assertEqual(client.get('/product/1', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_order_bump_writes_only_its_product_version(self):
+        Ask.objects.create(user_id=1, product_size_id=1, price=250, order_status_id=1, shipping_information_id=1)
+
+        with self.assertNumQueries(2):
+            run_commit_hooks()
+
+        self.assertEqual(list(ProductVersion.objects.values_list('product_id', 'version')), [(1, 2)])
+
+    def test_rolled_back_writes_do_not_bump_versions(self):
+        with transaction.atomic():
+            Ask.objects.create(user_id=1, product_size_id=1, price=250, order_status_id=1, shipping_information_id=1)
+            transaction.set_rollback(True)
+
+        Product.objects.create(id=2, name='Dunk', model_number='test102', ticker_number='DK102', color='white',
+            description='this is a test', retail_price=100, release_date='2020-02-14')
+        run_commit_hooks()
+
+        self.assertEqual(dict(ProductVersion.objects.values_list('product_id', 'version')), {1: 1, 2: 1})
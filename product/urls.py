@@ -1,7 +1,9 @@
 from django.urls import path
-from .views      import ProductDetailView, ProductListView
+from .views      import ProductDetailView, ProductListView, ProductSalesView, ProductCandleView
 
 urlpatterns = [
         path('', ProductListView.as_view()),
         path('/<int:product_id>', ProductDetailView.as_view()),
+        path('/<int:product_id>/sales', ProductSalesView.as_view()),
+        path('/<int:product_id>/candles', ProductCandleView.as_view()),
         ]
@@ -1,96 +1,216 @@
-import json
+import hashlib
+from datetime import datetime, date, time
+from decimal  import Decimal, InvalidOperation
 
-from django.views     import View
-from django.http      import JsonResponse
-from django.db.models import Q, Min, Avg
+import numpy as np
 
-from .models          import Product, Image, Size, ProductSize 
-from order.models     import Ask, Bid, OrderStatus, ExpirationType
+from django.conf                   import settings
+from django.core.cache             import cache
+from django.utils.decorators       import method_decorator
+from django.views.decorators.http  import condition
+from django.views                  import View
+from django.http                   import JsonResponse
+from django.db.models              import Q, Avg, Count, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions    import Coalesce
+
+from .models                       import Product, Image, ProductSize, sizes, product_versions
+from order.models                  import Ask, Bid, OrderStatus, ExpirationType, order_status_id
+from utils                         import encode_cursor, decode_cursor, page_limit
 
 ORDER_STATUS_CURRENT   = 'current'
 ORDER_STATUS_HISTORY   = 'history'
+PRODUCT_SORT_ID        = 'id'
+PRODUCT_SORT_PRICE     = 'price'
+PRODUCT_PAGE_SIZE      = 20
+PRODUCT_PAGE_SIZE_MAX  = 100
+SALES_PAGE_SIZE        = 50
+SALES_PAGE_SIZE_MAX    = 200
+CANDLE_INTERVAL_DAY    = '1d'
+CANDLE_INTERVAL_WEEK   = '1w'
+CANDLE_INTERVAL_MONTH  = '1m'
+CANDLE_CACHE_TIMEOUT   = 60 * 60 * 24
+
+def serialize_sale(ask):
+    return {
+        'sale_price' : int(ask.price),
+        'date_time'  : ask.matched_at.strftime('%Y-%m-%d'),
+        'time'       : ask.matched_at.strftime('%H:%m')
+    }
+
+def candle_buckets(matched_at, interval):
+    days = matched_at.astype('datetime64[D]')
+
+    if interval == CANDLE_INTERVAL_WEEK:
+        return days - (days.astype('int64') + 3) % 7
+
+    if interval == CANDLE_INTERVAL_MONTH:
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+
+    return days
+
+def build_candles(matched_at, prices, interval):
+    if not len(prices):
+        return []
+
+    buckets = candle_buckets(matched_at, interval)
+    starts  = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends    = np.r_[starts[1:], len(prices)]
+
+    return [
+        {
+            'time'   : str(bucket),
+            'open'   : int(open_price),
+            'high'   : int(high_price),
+            'low'    : int(low_price),
+            'close'  : int(close_price),
+            'volume' : int(volume)
+        } for bucket, open_price, high_price, low_price, close_price, volume in zip(
+            buckets[starts],
+            prices[starts],
+            np.maximum.reduceat(prices, starts),
+            np.minimum.reduceat(prices, starts),
+            prices[ends - 1],
+            ends - starts
+        )]
+
+def product_version(request, product_id=None):
+    if not hasattr(request, 'product_version'):
+        request.product_version = product_versions.get(product_id)
+
+    return request.product_version
+
+def product_etag(request, product_id=None):
+    version = product_version(request, product_id)
+    return hashlib.md5(f"{product_id or 0}:{version.version if version else 0}:{version.updated_at if version else ''}".encode()).hexdigest()
+
+def product_last_modified(request, product_id=None):
+    version = product_version(request, product_id)
+    return version.updated_at if version else None
 
 class ProductListView(View):
+    @method_decorator(condition(etag_func=product_etag, last_modified_func=product_last_modified))
     def get(self, request):
         lowest_price  = request.GET.get('lowest')
         highest_price = request.GET.get('highest')
-        limit         = int(request.GET.get('limit', 0))
-        offset        = int(request.GET.get('offset', 0))
-        size          = int(request.GET.get('size', 0))
-        
-        if not size:
-            products = Product.objects.all()
-            price_condition = Q()
-
-            if lowest_price and highest_price:
-                price_condition.add(Q(min_price__gte=lowest_price) & Q(min_price__lte=highest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT), Q.AND)
-
-            if lowest_price and not highest_price:
-                price_condition.add(Q(min_price__lte=lowest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT), Q.AND)
-
-            if highest_price and not lowest_price:
-                price_condition.add(Q(min_price__gte=highest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT), Q.AND)
-            
-            products = Product.objects.annotate(min_price=Min('productsize__ask__price')).filter(price_condition)
-
-            total_products = [
-                {'productId'   : product.id,
-                'productName'  : product.name,
-                'productImage' : product.image_set.first().image_url,
-                'price'        : min([int(ask.price) for ask in Ask.objects.filter(
-                            product_size__product_id = product.id)])} 
-                    for product in products][offset:offset+limit]
-
-            size_categories = [
-                    {
-                        'size'     : size.id,
-                        'sizeName' : size.name
-                        }
-                    for size in Size.objects.all()]
-
-            return JsonResponse({'products': total_products, 'size_categories': size_categories}, status=200)
+        sort          = request.GET.get('sort', PRODUCT_SORT_ID)
+        cursor        = request.GET.get('cursor')
+
+        try:
+            limit  = page_limit(request.GET.get('limit'), PRODUCT_PAGE_SIZE, PRODUCT_PAGE_SIZE_MAX)
+            offset = int(request.GET.get('offset', 0))
+            size   = int(request.GET.get('size', 0))
+        except ValueError:
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        if sort not in (PRODUCT_SORT_ID, PRODUCT_SORT_PRICE) or offset < 0:
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        lowest_ask = Ask.objects.filter(
+            product_size__product_id = OuterRef('pk'),
+            order_status_id          = order_status_id(ORDER_STATUS_CURRENT)
+        ).order_by('price').values('price')[:1]
+
+        primary_image = Image.objects.filter(product_id=OuterRef('pk')).order_by('id').values('image_url')[:1]
 
         price_condition = Q()
 
+        if size:
+            price_condition.add(Q(productsize__size_id=size), Q.AND)
+
         if lowest_price and highest_price:
-            price_condition.add(Q(min_price__gte=lowest_price) & Q(min_price__lte=highest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT) & Q(productsize__size_id=size), Q.AND)
-        
+            price_condition.add(Q(min_price__gte=lowest_price) & Q(min_price__lte=highest_price), Q.AND)
+
         if lowest_price and not highest_price:
-            price_condition.add(Q(min_price__lte=lowest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT) & Q(productsize__size_id=size), Q.AND)
+            price_condition.add(Q(min_price__lte=lowest_price), Q.AND)
 
         if highest_price and not lowest_price:
-            price_condition.add(Q(min_price__gte=highest_price) & Q(productsize__ask__order_status__name=ORDER_STATUS_CURRENT) & Q(productsize__size_id=size), Q.AND)
-            
-        if not highest_price and not lowest_price:
-            price_condition.add(Q(productsize__size_id=size), Q.AND)
+            price_condition.add(Q(min_price__gte=highest_price), Q.AND)
+
+        products = Product.objects.annotate(
+            min_price  = Subquery(lowest_ask),
+            image_url  = Subquery(primary_image),
+            sort_price = Coalesce('min_price', Value(0), output_field=DecimalField())
+        ).filter(price_condition)
+
+        products = products.order_by('id') if sort == PRODUCT_SORT_ID else products.order_by('sort_price', 'id')
+
+        if cursor is None:
+            products = products[offset:offset+limit]
+        else:
+            try:
+                position = decode_cursor(cursor) if cursor else None
+                position = {'id': int(position['id']), 'price': Decimal(position['price'])} if position else None
+            except (ValueError, KeyError, TypeError, InvalidOperation):
+                return JsonResponse({'message':'INVALID_CURSOR'}, status=400)
+
+            if position and sort == PRODUCT_SORT_ID:
+                products = products.filter(id__gt=position['id'])
+
+            if position and sort == PRODUCT_SORT_PRICE:
+                products = products.filter(
+                    Q(sort_price__gt=position['price']) | Q(sort_price=position['price'], id__gt=position['id']))
+
+            products = list(products[:limit+1])
 
-        products = Product.objects.annotate(min_price=Min('productsize__ask__price')).filter(price_condition)
-        
         total_products = [
             {'productId'   : product.id,
             'productName'  : product.name,
-            'productImage' : product.image_set.first().image_url,
-            'price'        : min([int(ask.price) for ask in Ask.objects.filter(
-                        product_size__product_id = product.id)]) if Ask.objects.filter(product_size__product_id = product.id) else 0 } 
-                for product in products][offset:offset+limit]
-        
+            'productImage' : product.image_url,
+            'price'        : int(product.min_price) if product.min_price is not None else 0}
+                for product in products[:limit]]
+
         size_categories = [
                 {
                     'size'     : size.id,
                     'sizeName' : size.name
                     }
-                for size in Size.objects.all()]
+                for size in sizes.all()]
 
-        return JsonResponse({'products': total_products, 'size_categories': size_categories}, status=200)
+        results = {'products': total_products, 'size_categories': size_categories}
+
+        if cursor is not None:
+            results['nextCursor'] = encode_cursor({'id': products[limit-1].id, 'price': str(products[limit-1].sort_price)}) \
+                                    if len(products) > limit else None
+
+        return JsonResponse(results, status=200)
 
 class ProductDetailView(View):
+    @method_decorator(condition(etag_func=product_etag, last_modified_func=product_last_modified))
     def get(self, request, product_id):
-        if not Product.objects.filter(id=product_id).exists():
+        product = Product.objects.filter(id=product_id).first()
+
+        if not product:
             return JsonResponse({'message':'PAGE_NOT_FOUND'}, status=404)
 
-        product       = Product.objects.get(id=product_id)
-        product_sizes = product.productsize_set.all()
-        sizes         = Size.objects.filter(productsize__product__id=product.id)
+        current_asks = Ask.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+        current_bids = Bid.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_CURRENT))
+        sales        = Ask.objects.filter(product_size_id=OuterRef('pk'), order_status_id=order_status_id(ORDER_STATUS_HISTORY))
+        sale_groups  = sales.order_by().values('product_size_id')
+
+        product_sizes = ProductSize.objects.filter(product_id=product.id).select_related('size').annotate(
+            lowest_ask         = Subquery(current_asks.order_by('price').values('price')[:1]),
+            highest_bid        = Subquery(current_bids.order_by('-price').values('price')[:1]),
+            last_sale          = Subquery(sales.order_by('-id').values('price')[:1]),
+            latest_sale        = Subquery(sales.order_by('-matched_at').values('price')[:1]),
+            previous_sale      = Subquery(sales.order_by('-matched_at').values('price')[1:2]),
+            total_sales        = Subquery(sale_groups.annotate(total=Count('id')).values('total')),
+            average_sale_price = Subquery(sale_groups.annotate(average=Avg('price')).values('average')),
+            history_cutoff     = Subquery(sales.order_by('-matched_at', '-id').values('matched_at')\
+                                    [settings.SALES_HISTORY_LIMIT-1:settings.SALES_HISTORY_LIMIT])
+        ).order_by('id')
+
+        history_condition = Q()
+
+        for product_size in product_sizes:
+            history_condition.add(Q(product_size_id=product_size.id, matched_at__gte=product_size.history_cutoff) \
+                    if product_size.history_cutoff else Q(product_size_id=product_size.id), Q.OR)
+
+        sales_history = {}
+
+        if history_condition:
+            for ask in Ask.objects.filter(history_condition, order_status_id=order_status_id(ORDER_STATUS_HISTORY))\
+                    .order_by('matched_at', 'id').only('product_size_id', 'price', 'matched_at'):
+                sales_history.setdefault(ask.product_size_id, []).append(serialize_sale(ask))
 
         results = {
                 'product_id'     : product.id,
@@ -106,33 +226,99 @@ class ProductDetailView(View):
         results['sizes'] = [
                 {
                     'size_id'                 : product_size.size_id,
-                    'size_name'               : Size.objects.get(id=product_size.size_id).name,
-                    'last_sale'               : int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).last().price) \
-                                                if product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).exists() else 0,
-                    'price_change'            : int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).order_by('-matched_at')[0].price) \
-                                                - int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).order_by('-matched_at')[1].price) \
-                                                if product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY) else 0,
-                    
-                    'price_change_percentage' : int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).order_by('-matched_at')[0].price) \
-                                                - int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).order_by('-matched_at')[1].price) \
-                                                if product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY) else 0,
-                    'lowest_ask'              : int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('price').first().price) \
-                                                if product_size.ask_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-                    'highest_bid'             : int(product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT).order_by('-price').first().price) \
-                                                if product_size.bid_set.filter(order_status__name=ORDER_STATUS_CURRENT) else 0,
-                    'total_sales'             : product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).count(),
-                    'price_premium'           : int(100 * (int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).last().price) - int(product.retail_price)) \
-                                                / int(product.retail_price)) if product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).last() else 0,
-                    'average_sale_price'      : int(product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).aggregate(total=Avg('price'))['total']) \
-                                                if product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY).exists() else 0,
-                    'sales_history':   
-                    [
-                        {
-                            'sale_price'     : int(ask.price),
-                            'date_time'      : ask.matched_at.strftime('%Y-%m-%d'),
-                            'time'           : ask.matched_at.strftime('%H:%m')
-                            }
-                        for ask in product_size.ask_set.filter(order_status__name=ORDER_STATUS_HISTORY)]
+                    'size_name'               : product_size.size.name,
+                    'last_sale'               : int(product_size.last_sale) if product_size.last_sale is not None else 0,
+                    'price_change'            : int(product_size.latest_sale) - int(product_size.previous_sale) \
+                                                if product_size.previous_sale is not None else 0,
+                    'price_change_percentage' : int(product_size.latest_sale) - int(product_size.previous_sale) \
+                                                if product_size.previous_sale is not None else 0,
+                    'lowest_ask'              : int(product_size.lowest_ask) if product_size.lowest_ask is not None else 0,
+                    'highest_bid'             : int(product_size.highest_bid) if product_size.highest_bid is not None else 0,
+                    'total_sales'             : product_size.total_sales or 0,
+                    'price_premium'           : int(100 * (int(product_size.last_sale) - int(product.retail_price)) / int(product.retail_price)) \
+                                                if product_size.last_sale is not None else 0,
+                    'average_sale_price'      : int(product_size.average_sale_price) if product_size.average_sale_price is not None else 0,
+                    'sales_history'           : sales_history.get(product_size.id, [])[-settings.SALES_HISTORY_LIMIT:]
                 } for product_size in product_sizes]
 
         return JsonResponse({'results': results}, status=200)
+
+class ProductSalesView(View):
+    def get(self, request, product_id):
+        cursor = request.GET.get('cursor')
+
+        try:
+            size  = int(request.GET.get('size', 0))
+            limit = page_limit(request.GET.get('limit'), SALES_PAGE_SIZE, SALES_PAGE_SIZE_MAX)
+        except ValueError:
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        if not Product.objects.filter(id=product_id).exists():
+            return JsonResponse({'message':'PAGE_NOT_FOUND'}, status=404)
+
+        sales = Ask.objects.filter(product_size__product_id=product_id, order_status_id=order_status_id(ORDER_STATUS_HISTORY))
+
+        if size:
+            sales = sales.filter(product_size__size_id=size)
+
+        if cursor:
+            try:
+                position   = decode_cursor(cursor)
+                matched_at = datetime.fromisoformat(position['matched_at'])
+                sales      = sales.filter(Q(matched_at__lt=matched_at) | Q(matched_at=matched_at, id__lt=int(position['id'])))
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse({'message':'INVALID_CURSOR'}, status=400)
+
+        sales = list(sales.select_related('product_size').order_by('-matched_at', '-id')[:limit+1])
+
+        results = [
+            {'size_id': ask.product_size.size_id, **serialize_sale(ask)}
+                for ask in sales[:limit]]
+
+        next_cursor = encode_cursor({'matched_at': sales[limit-1].matched_at.isoformat(), 'id': sales[limit-1].id}) \
+                if len(sales) > limit else None
+
+        return JsonResponse({'sales': results, 'nextCursor': next_cursor}, status=200)
+
+class ProductCandleView(View):
+    def get(self, request, product_id):
+        interval = request.GET.get('interval', CANDLE_INTERVAL_DAY)
+
+        try:
+            size = int(request.GET.get('size', 0))
+        except ValueError:
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        if interval not in (CANDLE_INTERVAL_DAY, CANDLE_INTERVAL_WEEK, CANDLE_INTERVAL_MONTH):
+            return JsonResponse({'message':'INVALID_VALUE'}, status=400)
+
+        if not Product.objects.filter(id=product_id).exists():
+            return JsonResponse({'message':'PAGE_NOT_FOUND'}, status=404)
+
+        open_bucket = candle_buckets(np.array([datetime.now()], dtype='datetime64[us]'), interval)[0]
+        cache_key   = f'candles:{product_id}:{size}:{interval}'
+        cached      = cache.get(cache_key, {'closed_before': None, 'candles': []})
+        trades      = Ask.objects.filter(product_size__product_id=product_id, matched_at__isnull=False)
+
+        if size:
+            trades = trades.filter(product_size__size_id=size)
+
+        if cached['closed_before']:
+            trades = trades.filter(matched_at__gte=cached['closed_before'])
+
+        trades  = list(trades.order_by('matched_at', 'id').values_list('matched_at', 'price'))
+        candles = build_candles(
+            np.array([trade[0] for trade in trades], dtype='datetime64[us]'),
+            np.array([trade[1] for trade in trades], dtype='float64'),
+            interval
+        )
+
+        closed_candles = [candle for candle in candles if candle['time'] < str(open_bucket)]
+        open_candles   = [candle for candle in candles if candle['time'] >= str(open_bucket)]
+
+        cache.set(cache_key, {
+            'closed_before' : datetime.combine(open_bucket.astype(date), time()),
+            'candles'       : cached['candles'] + closed_candles
+        }, CANDLE_CACHE_TIMEOUT)
+
+        return JsonResponse({'candles': cached['candles'] + closed_candles + open_candles}, status=200)
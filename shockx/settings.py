@@ -42,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'utils.TokenAuthenticationMiddleware',
 ]
 
 ROOT_URLCONF = 'shockx.urls'
@@ -137,3 +138,39 @@ CORS_ALLOW_HEADERS = (
 #REMOVE_APPEND_SLASH_WARNING
 APPEND_SLASH = False
 
+
+##AUTH
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL  = 300
+
+##KAKAO
+KAKAO_PROFILE_URL     = 'https://kapi.kakao.com/v2/user/me'
+KAKAO_CONNECT_TIMEOUT = 3
+KAKAO_READ_TIMEOUT    = 5
+KAKAO_POOL_SIZE       = 10
+
+KAKAO_PROFILE_CACHE_SIZE    = 10000
+KAKAO_PROFILE_CACHE_TTL     = 60
+KAKAO_BREAKER_THRESHOLD     = 5
+KAKAO_BREAKER_RESET_TIMEOUT = 30
+
+##ORDER BOOK
+ORDER_BOOK_ENABLED            = False
+ORDER_BOOK_RECONCILE_INTERVAL = 60
+
+##ORDER INTAKE
+ORDER_INTAKE_ASYNC        = False
+ORDER_INTAKE_MAX_ATTEMPTS = 3
+
+##ORDER EXPIRATION
+ORDER_EXPIRATION_BATCH_SIZE     = 500
+ORDER_EXPIRATION_SWEEP_INTERVAL = None
+
+##ORDER NUMBER
+ORDER_NUMBER_BLOCK_SIZE = 100
+
+##MARKET VALUE
+MARKET_VALUE_CACHE_TTL = 300
+
+##PRODUCT DETAIL
+SALES_HISTORY_LIMIT = 20
@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shockx.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.ORDER_BOOK_ENABLED:
+    from order.book import order_books, order_book_reconciler
+
+    order_books.load()
+
+    if settings.ORDER_BOOK_RECONCILE_INTERVAL:
+        order_book_reconciler.start(settings.ORDER_BOOK_RECONCILE_INTERVAL)
+
+if settings.ORDER_EXPIRATION_SWEEP_INTERVAL:
+    from order.expiration import expiration_sweeper
+
+    expiration_sweeper.start(settings.ORDER_EXPIRATION_SWEEP_INTERVAL)
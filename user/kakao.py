@@ -0,0 +1,216 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+KAKAO_PROFILE_URL = 'https://kapi.kakao.com/v2/user/me'
+
+CIRCUIT_CLOSED    = 'closed'
+CIRCUIT_OPEN      = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+class KakaoError(Exception):
+    pass
+
+class CircuitOpenError(KakaoError):
+    pass
+
+class KakaoProfileCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def maxsize(self):
+        return getattr(settings, 'KAKAO_PROFILE_CACHE_SIZE', 10000)
+
+    def ttl(self):
+        return getattr(settings, 'KAKAO_PROFILE_CACHE_TTL', 60)
+
+    def key(self, access_token):
+        return hashlib.sha256(access_token.encode()).hexdigest()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+
+    def get(self, access_token):
+        key = self.key(access_token)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if not entry:
+                return None
+
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry[1]
+
+    def set(self, access_token, profile):
+        if self.ttl() <= 0 or not self.maxsize():
+            return
+
+        key = self.key(access_token)
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl(), profile)
+
+            while len(self.entries) > self.maxsize():
+                self.entries.popitem(last=False)
+
+class CircuitBreaker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def threshold(self):
+        return getattr(settings, 'KAKAO_BREAKER_THRESHOLD', 5)
+
+    def reset_timeout(self):
+        return getattr(settings, 'KAKAO_BREAKER_RESET_TIMEOUT', 30)
+
+    def reset(self):
+        with self.lock:
+            self.state     = CIRCUIT_CLOSED
+            self.failures  = 0
+            self.opened_at = None
+            self.probing   = False
+            self.counts    = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'state'                : self.state,
+                'consecutive_failures' : self.failures,
+                'opened_at'            : self.opened_at,
+                'counts'               : dict(self.counts),
+            }
+
+    def acquire(self):
+        with self.lock:
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout():
+                self.state = CIRCUIT_HALF_OPEN
+
+            # while half open a single request probes the upstream and the rest keep failing fast
+            if self.state == CIRCUIT_OPEN or (self.state == CIRCUIT_HALF_OPEN and self.probing):
+                self.counts['rejected'] += 1
+                raise CircuitOpenError('circuit open')
+
+            self.probing = self.state == CIRCUIT_HALF_OPEN
+
+    def succeed(self):
+        with self.lock:
+            self.state     = CIRCUIT_CLOSED
+            self.failures  = 0
+            self.opened_at = None
+            self.probing   = False
+
+            self.counts['successes'] += 1
+
+    def fail(self):
+        with self.lock:
+            self.failures           += 1
+            self.counts['failures'] += 1
+
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.threshold():
+                self.state     = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+
+                self.counts['opened'] += 1
+
+            self.probing = False
+
+    def call(self, func, *args):
+        self.acquire()
+
+        try:
+            result = func(*args)
+        except KakaoError:
+            self.fail()
+            raise
+
+        self.succeed()
+
+        return result
+
+class KakaoClient:
+    def __init__(self):
+        self.session  = None
+        self.lock     = threading.Lock()
+        self.profiles = KakaoProfileCache()
+        self.breaker  = CircuitBreaker()
+
+    def profile_url(self):
+        return getattr(settings, 'KAKAO_PROFILE_URL', KAKAO_PROFILE_URL)
+
+    def timeout(self):
+        return (getattr(settings, 'KAKAO_CONNECT_TIMEOUT', 3), getattr(settings, 'KAKAO_READ_TIMEOUT', 5))
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                pool_size = getattr(settings, 'KAKAO_POOL_SIZE', 10)
+                adapter   = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+                self.session = requests.Session()
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+
+            return self.session
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def clear(self):
+        self.close()
+        self.profiles.clear()
+        self.breaker.reset()
+
+    def metrics(self):
+        return {'breaker': self.breaker.metrics(), 'cached_profiles': len(self.profiles.entries)}
+
+    def profile(self, access_token):
+        profile = self.profiles.get(access_token)
+
+        if profile is None:
+            profile = self.breaker.call(self.fetch, access_token)
+
+            # rejected tokens come back without an account and are not worth remembering
+            if 'kakao_account' in profile:
+                self.profiles.set(access_token, profile)
+
+        return profile
+
+    def fetch(self, access_token):
+        try:
+            response = self.get_session().get(
+                self.profile_url(),
+                headers = {'Authorization': f'Bearer {access_token}'},
+                timeout = self.timeout()
+            )
+        except requests.RequestException as error:
+            raise KakaoError(str(error))
+
+        # 4xx bodies describe a rejected token and are handled by the caller like any other profile
+        if response.status_code >= 500:
+            raise KakaoError(f'status {response.status_code}')
+
+        try:
+            return response.json()
+        except ValueError:
+            raise KakaoError('invalid response')
+
+kakao_client = KakaoClient()
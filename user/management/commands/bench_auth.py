@@ -0,0 +1,59 @@
+import time
+
+import jwt
+
+from django.core.management.base import BaseCommand
+from django.db                   import transaction
+from django.http                 import JsonResponse
+from django.test                 import RequestFactory
+
+from my_settings                 import SECRET_KEY, ALGORITHM
+from user.models                 import User
+from utils                       import login_decorator, verified_tokens
+
+class BenchView:
+    @login_decorator
+    def get(self, request):
+        return JsonResponse({'id': request.user.id})
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of login_decorator with and without the verified-token cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+
+        with transaction.atomic():
+            user        = User.objects.create(email=f'bench-{time.time()}@shockx', name='bench')
+            email_token = jwt.encode({'email': user.email}, SECRET_KEY, algorithm=ALGORITHM)
+            id_token    = jwt.encode({'id': user.id, 'email': user.email}, SECRET_KEY, algorithm=ALGORITHM)
+            view        = BenchView()
+
+            results = [
+                ('decode + email lookup', self.run(view, email_token, count, cached=False)),
+                ('decode + id lookup', self.run(view, id_token, count, cached=False)),
+                ('verified-token cache', self.run(view, id_token, count, cached=True)),
+            ]
+
+            transaction.set_rollback(True)
+
+        verified_tokens.clear()
+
+        for label, elapsed in results:
+            self.stdout.write(f'{label:<22}: {elapsed / count * 1000000:8.1f} us/request')
+
+    def run(self, view, token, count, cached):
+        factory    = RequestFactory()
+        started_at = time.perf_counter()
+
+        verified_tokens.clear()
+
+        for _ in range(count):
+            if not cached:
+                verified_tokens.clear()
+
+            view.get(factory.get('/', HTTP_AUTHORIZATION=token))
+
+        return time.perf_counter() - started_at
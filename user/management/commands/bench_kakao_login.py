@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db                   import transaction
+from django.test                 import RequestFactory, override_settings
+
+from user.kakao                  import kakao_client
+from user.testing                import StubKakaoServer
+from user.views                  import KakaoSocialLogin
+
+class Command(BaseCommand):
+    help = 'Measure KakaoSocialLogin throughput against a local stub of the Kakao profile API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--delay', type=float, default=0)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+
+        with StubKakaoServer(delay=options['delay']) as server, override_settings(KAKAO_PROFILE_URL=server.url):
+            with transaction.atomic():
+                with override_settings(KAKAO_PROFILE_CACHE_TTL=0):
+                    results = [
+                        ('new connection per login', self.run(count, options['users'], pooled=False)),
+                        ('pooled session', self.run(count, options['users'], pooled=True)),
+                    ]
+
+                results.append(('pooled + profile cache', self.run(count, options['users'], pooled=True)))
+
+                transaction.set_rollback(True)
+
+            metrics = kakao_client.metrics()
+            kakao_client.clear()
+
+        for label, elapsed in results:
+            self.stdout.write(f'{label:<24}: {elapsed / count * 1000:8.3f} ms/login, {count / elapsed:8.1f} logins/s')
+
+        self.stdout.write(f'stub served {server.requests} requests over {server.connections} connections')
+        self.stdout.write(f'breaker: {metrics["breaker"]}')
+
+    def run(self, count, users, pooled):
+        factory    = RequestFactory()
+        view       = KakaoSocialLogin.as_view()
+        started_at = time.perf_counter()
+
+        kakao_client.clear()
+
+        for index in range(count):
+            if not pooled:
+                kakao_client.close()
+
+            view(factory.post('/user/kakao', HTTP_AUTHORIZATION=f'bench-{index % users}'))
+
+        return time.perf_counter() - started_at
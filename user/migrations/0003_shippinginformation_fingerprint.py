@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_auto_20210311_1627'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shippinginformation',
+            name='fingerprint',
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:17
+
+import hashlib
+
+from django.db import migrations
+
+ADDRESS_FIELDS = [
+    'name', 'country', 'primary_address', 'secondary_address', 'city', 'state', 'postal_code', 'phone_number'
+]
+
+def address_fingerprint(address):
+    normalized = [' '.join(str(getattr(address, field) or '').split()).casefold() for field in ADDRESS_FIELDS]
+
+    return hashlib.sha256('\x1f'.join(normalized).encode()).hexdigest()
+
+def merge_shipping_information_duplicates(apps, schema_editor):
+    ShippingInformation = apps.get_model('user', 'ShippingInformation')
+    Ask                 = apps.get_model('order', 'Ask')
+    Bid                 = apps.get_model('order', 'Bid')
+
+    kept       = {}
+    duplicates = {}
+    batch      = []
+
+    for shipping_information in ShippingInformation.objects.order_by('id').iterator():
+        shipping_information.fingerprint = address_fingerprint(shipping_information)
+        key                              = (shipping_information.user_id, shipping_information.fingerprint)
+
+        # the latest address is the one the order forms prefill, so duplicates are merged into it
+        if key in kept:
+            duplicates.setdefault(key, []).append(kept[key])
+
+        kept[key] = shipping_information.id
+        batch.append(shipping_information)
+
+        if len(batch) == 1000:
+            ShippingInformation.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+
+    ShippingInformation.objects.bulk_update(batch, ['fingerprint'])
+
+    for key, duplicate_ids in duplicates.items():
+        Ask.objects.filter(shipping_information_id__in=duplicate_ids).update(shipping_information_id=kept[key])
+        Bid.objects.filter(shipping_information_id__in=duplicate_ids).update(shipping_information_id=kept[key])
+        ShippingInformation.objects.filter(id__in=duplicate_ids).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_shippinginformation_fingerprint'),
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_shipping_information_duplicates, migrations.RunPython.noop),
+    ]
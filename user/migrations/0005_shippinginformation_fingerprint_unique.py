@@ -0,0 +1,22 @@
+# Generated by Django 3.1.6 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_merge_shipping_information_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shippinginformation',
+            name='fingerprint',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='shippinginformation',
+            constraint=models.UniqueConstraint(fields=('user', 'fingerprint'), name='shipping_informations_user_fingerprint'),
+        ),
+    ]
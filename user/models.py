@@ -1,5 +1,16 @@
+import hashlib
+
 from django.db import models
 
+ADDRESS_FIELDS = [
+    'name', 'country', 'primary_address', 'secondary_address', 'city', 'state', 'postal_code', 'phone_number'
+]
+
+def address_fingerprint(address):
+    normalized = [' '.join(str(address.get(field) or '').split()).casefold() for field in ADDRESS_FIELDS]
+
+    return hashlib.sha256('\x1f'.join(normalized).encode()).hexdigest()
+
 class User(models.Model):
     email           = models.CharField(max_length=100, unique=True)
     name            = models.CharField(max_length=50)
@@ -9,6 +20,14 @@ class User(models.Model):
     class Meta:
         db_table = 'users'
 
+class ShippingInformationManager(models.Manager):
+    def upsert(self, user, address):
+        return self.get_or_create(
+            user_id     = user.id,
+            fingerprint = address_fingerprint(address),
+            defaults    = {field: address.get(field) for field in ADDRESS_FIELDS}
+        )
+
 class ShippingInformation(models.Model):
     name              = models.CharField(max_length=50)
     country           = models.CharField(max_length=50)
@@ -21,9 +40,23 @@ class ShippingInformation(models.Model):
     created_at        = models.DateTimeField(auto_now_add=True)
     updated_at        = models.DateTimeField(auto_now=True)
     user              = models.ForeignKey('User', on_delete=models.CASCADE)
+    fingerprint       = models.CharField(max_length=64)
+
+    objects = ShippingInformationManager()
 
     class Meta:
-        db_table = 'shipping_informations'
+        db_table    = 'shipping_informations'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'fingerprint'], name='shipping_informations_user_fingerprint'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = address_fingerprint(self.__dict__)
+
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'fingerprint'}
+
+        super().save(*args, **kwargs)
 
 class Portfolio(models.Model):
     user           = models.ForeignKey('User', on_delete=models.CASCADE)
@@ -0,0 +1,77 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubKakaoHandler(BaseHTTPRequestHandler):
+    protocol_version        = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server       = self.server
+        access_token = self.headers.get('Authorization', '').replace('Bearer ', '', 1)
+
+        with server.lock:
+            server.requests += 1
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        status, body = server.respond(access_token)
+        body         = json.dumps(body).encode()
+
+        # a client that timed out has already hung up, which is the point of a delayed stub
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+class StubKakaoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, status=200, delay=0):
+        super().__init__(('127.0.0.1', 0), StubKakaoHandler)
+        self.status      = status
+        self.delay       = delay
+        self.requests    = 0
+        self.connections = 0
+        self.lock        = threading.Lock()
+        self.thread      = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v2/user/me'
+
+    def respond(self, access_token):
+        if self.status != 200:
+            return self.status, {'msg': 'stubbed failure', 'code': -self.status}
+
+        return 200, {
+            'kakao_account' : {
+                'email'   : f'{access_token}@kakao.stub',
+                'profile' : {'nickname': access_token}
+            }
+        }
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
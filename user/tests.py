@@ -1,15 +1,21 @@
 import json
 import jwt
+import time
 import bcrypt
 from datetime import datetime
 
-from django.test   import TestCase, Client
-from unittest.mock import patch, MagicMock
+from django.db         import connection
+from django.test       import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest.mock     import patch, MagicMock
 
 from user.models    import User, ShippingInformation, Portfolio
+from user.kakao     import kakao_client, KakaoError, CircuitOpenError
+from user.testing   import StubKakaoServer
 from product.models import Product, Size, ProductSize, Image
-from order.models   import Bid, Ask, Order, OrderStatus
+from order.models   import Bid, Ask, Order, OrderStatus, market_values
 from my_settings    import SECRET_KEY, ALGORITHM
+from utils          import authenticate, verified_tokens, TokenAuthenticationMiddleware
 
 ORDER_STATUS_CURRENT = 'current'
 ORDER_STATUS_PENDING = 'pending' 
@@ -96,6 +102,9 @@ class PortfolioTest(TestCase):
         )
 
         cls.token = jwt.encode({'email':user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def setUp(self):
+        market_values.clear()
     
     def tearDown(self):
         User.objects.all().delete()
@@ -129,6 +138,43 @@ class PortfolioTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_portfolio_market_values_are_grouped_and_cached(self):
+        user         = User.objects.get(email='shockx@wecode.com')
+        product      = Product.objects.create(name='Dunk', model_number='B1234', ticker_number='DK01', color='white',
+                        description='Niiice', retail_price=100.00, release_date='2020-11-10')
+        product_size = ProductSize.objects.create(product=product, size=self.size)
+
+        Portfolio.objects.create(user=user, product_size=product_size, purchase_date='2020-02-01', purchase_price='90')
+
+        headers = {'HTTP_Authorization':self.token}
+
+        client.get('/user/portfolio', **headers)
+        market_values.clear()
+
+        with self.assertNumQueries(2):
+            response = client.get('/user/portfolio', **headers)
+
+        self.assertEqual([portfolio['market_value'] for portfolio in response.json()['portfolio']], [150, 0])
+
+        with self.assertNumQueries(1):
+            client.get('/user/portfolio', **headers)
+
+        shipping_information = ShippingInformation.objects.get(user=user)
+
+        with self.assertNumQueries(1):
+            Ask.objects.create(
+                product_size         = product_size,
+                price                = 120.00,
+                user                 = user,
+                expiration_date      = '2020-05-15',
+                order_status         = self.order_status_history,
+                shipping_information = shipping_information
+            )
+
+        response = client.get('/user/portfolio', **headers)
+
+        self.assertEqual([portfolio['market_value'] for portfolio in response.json()['portfolio']], [150, 120])
+
     def test_portfolio_post_success(self):
         headers = {'HTTP_Authorization':self.token}
         
@@ -280,11 +326,16 @@ class SocialLoginTest(TestCase):
             name = 'binoooo',
         )
 
-    @patch('user.views.requests')
+    def setUp(self):
+        kakao_client.clear()
+
+    @patch('user.kakao.kakao_client.session')
     def test_signup_post_pass(self, mock_requests):  
         client = Client()
 
         class MockedResponse:
+            status_code = 200
+
             def json(self):
                 return {
                     'kakao_account' : {
@@ -299,11 +350,13 @@ class SocialLoginTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
-    @patch('user.views.requests')
+    @patch('user.kakao.kakao_client.session')
     def test_signin_post_pass(self, mock_requests):  
         client = Client()
 
         class MockedResponse:
+            status_code = 200
+
             def json(self):
                 return {
                     'kakao_account' : {
@@ -318,11 +371,13 @@ class SocialLoginTest(TestCase):
 
         self.assertEqual(response.status_code, 201)
 
-    @patch('user.views.requests')
+    @patch('user.kakao.kakao_client.session')
     def test_signup_email_key_error(self, mock_requests):  
         client = Client()
 
         class MockedResponse:
+            status_code = 200
+
             def json(self):
                 return {
                     'kakao' : {
@@ -337,3 +392,206 @@ class SocialLoginTest(TestCase):
 
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json(), {'message': 'KEY_ERROR'})
+
+class ShippingInformationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='shockx@wecode.com', name='shocking')
+        cls.address = {
+            'name'            : 'bongbong',
+            'country'         : 'InSideOut',
+            'primary_address' : 'bongbong_station',
+            'city'            : 'dream',
+            'postal_code'     : '123456',
+            'phone_number'    : '01012341234',
+        }
+
+    def test_shipping_information_upsert_reuses_normalized_address(self):
+        shipping_information, created = ShippingInformation.objects.upsert(self.user, self.address)
+
+        with self.assertNumQueries(1):
+            same_information, same_created = ShippingInformation.objects.upsert(
+                self.user, dict(self.address, name=' BongBong ', state='')
+            )
+
+        self.assertTrue(created)
+        self.assertFalse(same_created)
+        self.assertEqual(same_information, shipping_information)
+        self.assertEqual(shipping_information.name, 'bongbong')
+
+    def test_shipping_information_upsert_creates_new_address(self):
+        ShippingInformation.objects.upsert(self.user, self.address)
+        ShippingInformation.objects.upsert(self.user, dict(self.address, city='nightmare'))
+
+        self.assertEqual(ShippingInformation.objects.filter(user=self.user).count(), 2)
+
+class VerifiedTokenCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user  = User.objects.create(email='shockx@wecode.com', name='shocking')
+        cls.token = jwt.encode({'id':cls.user.id, 'email':cls.user.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def setUp(self):
+        verified_tokens.clear()
+
+    def test_verified_token_is_served_from_cache(self):
+        with self.assertNumQueries(0):
+            user = authenticate(self.token)
+
+            self.assertEqual(user.id, self.user.id)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(user.name, 'shocking')
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('"users"."id" =', context.captured_queries[0]['sql'])
+
+        with self.assertNumQueries(0):
+            cached_user = authenticate(self.token)
+
+            self.assertEqual((cached_user.id, cached_user.name), (user.id, 'shocking'))
+
+        self.assertIsNot(cached_user, authenticate(self.token))
+
+    def test_verified_token_is_invalidated_when_user_changes(self):
+        authenticate(self.token).name
+
+        user      = User.objects.get(id=self.user.id)
+        user.name = 'shocked'
+        user.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(self.token).name, 'shocked')
+
+        user.delete()
+
+        with self.assertRaises(User.DoesNotExist):
+            authenticate(self.token).name
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=2)
+    def test_verified_token_cache_is_bounded(self):
+        tokens = [jwt.encode({'id':self.user.id, 'nonce':index}, SECRET_KEY, algorithm=ALGORITHM) for index in range(3)]
+
+        for token in tokens:
+            authenticate(token).name
+
+        self.assertEqual(list(verified_tokens.entries), tokens[1:])
+
+    def test_expired_token_is_rejected(self):
+        token = jwt.encode({'id':self.user.id, 'exp':int(time.time()) - 1}, SECRET_KEY, algorithm=ALGORITHM)
+
+        response = client.get('/user/portfolio', HTTP_Authorization=token)
+
+        self.assertEqual(response.json(), {'message':'INVALID_TOKEN'})
+
+    def test_middleware_authenticates_lazily(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=self.token)
+
+        with self.assertNumQueries(0):
+            TokenAuthenticationMiddleware(lambda request: None)(request)
+
+            self.assertEqual((request.user.id, request.auth_error), (self.user.id, None))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user.email, 'shockx@wecode.com')
+
+    def test_middleware_records_authentication_errors(self):
+        for headers, message in [({}, 'NEED_LOGIN'), ({'HTTP_AUTHORIZATION':'fake_token'}, 'INVALID_TOKEN')]:
+            request = RequestFactory().get('/', **headers)
+
+            TokenAuthenticationMiddleware(lambda request: None)(request)
+
+            self.assertEqual((request.user, request.auth_error), (None, message))
+
+    def test_deleted_user_is_rejected_when_loaded(self):
+        User.objects.get(id=self.user.id).delete()
+
+        response = client.get('/order/account/buying', HTTP_Authorization=self.token)
+
+        self.assertEqual(response.json(), {'message':'INVALID_USER'})
+
+class KakaoClientTest(TestCase):
+    def setUp(self):
+        kakao_client.clear()
+
+    def tearDown(self):
+        kakao_client.clear()
+
+    def test_login_reuses_pooled_connection(self):
+        with StubKakaoServer() as server, self.settings(KAKAO_PROFILE_URL=server.url, KAKAO_PROFILE_CACHE_TTL=0):
+            response = client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['user_name'], 'shocking')
+
+            with self.assertNumQueries(1):
+                response = client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((server.requests, server.connections), (2, 1))
+
+    def test_login_fails_fast_on_read_timeout(self):
+        with StubKakaoServer(delay=0.5) as server, self.settings(KAKAO_PROFILE_URL=server.url, KAKAO_READ_TIMEOUT=0.05):
+            started_at = time.perf_counter()
+            response   = client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertLess(time.perf_counter() - started_at, 0.5)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json(), {'message':'KAKAO_UNAVAILABLE'})
+
+    def test_upstream_server_error_raises(self):
+        with StubKakaoServer(status=502) as server, self.settings(KAKAO_PROFILE_URL=server.url):
+            with self.assertRaises(KakaoError):
+                kakao_client.profile('shocking')
+
+    def test_rejected_token_is_key_error(self):
+        with StubKakaoServer(status=401) as server, self.settings(KAKAO_PROFILE_URL=server.url):
+            response = client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertEqual(response.json(), {'message':'KEY_ERROR'})
+            self.assertFalse(User.objects.exists())
+
+    def test_profile_is_cached_by_token(self):
+        with StubKakaoServer() as server, self.settings(KAKAO_PROFILE_URL=server.url):
+            for token in ['shocking', 'shocking', 'shocked']:
+                client.post('/user/kakao', HTTP_Authorization=token)
+
+            self.assertEqual(server.requests, 2)
+            self.assertNotIn('shocking', kakao_client.profiles.entries)
+
+    @override_settings(KAKAO_BREAKER_THRESHOLD=2, KAKAO_BREAKER_RESET_TIMEOUT=0.1)
+    def test_breaker_fails_fast_and_recovers(self):
+        with StubKakaoServer(status=502) as server, self.settings(KAKAO_PROFILE_URL=server.url):
+            responses = [client.post('/user/kakao', HTTP_Authorization='shocking') for _ in range(3)]
+
+            self.assertEqual([response.status_code for response in responses], [503, 503, 503])
+            self.assertEqual(server.requests, 2)
+            self.assertEqual(kakao_client.metrics()['breaker']['state'], 'open')
+
+            with self.assertRaises(CircuitOpenError):
+                kakao_client.profile('shocked')
+
+            server.status = 200
+            time.sleep(0.1)
+
+            response = client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertEqual(response.status_code, 201)
+
+            metrics = kakao_client.metrics()['breaker']
+
+            self.assertEqual((metrics['state'], metrics['consecutive_failures']), ('closed', 0))
+            self.assertEqual(metrics['counts'], {'successes': 1, 'failures': 2, 'rejected': 2, 'opened': 1})
+
+    @override_settings(KAKAO_BREAKER_THRESHOLD=1, KAKAO_BREAKER_RESET_TIMEOUT=0.1)
+    def test_failed_probe_reopens_breaker(self):
+        with StubKakaoServer(status=500) as server, self.settings(KAKAO_PROFILE_URL=server.url):
+            client.post('/user/kakao', HTTP_Authorization='shocking')
+            time.sleep(0.1)
+            client.post('/user/kakao', HTTP_Authorization='shocking')
+
+            self.assertEqual(server.requests, 2)
+            self.assertEqual(kakao_client.metrics()['breaker']['counts']['opened'], 2)
+
+            with self.assertRaises(CircuitOpenError):
+                kakao_client.profile('shocking')
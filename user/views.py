@@ -1,36 +1,34 @@
 import json
 import calendar
 import jwt
-import requests
 from datetime         import datetime
 
 from django.http      import JsonResponse
 from django.views     import View
-from django.db.models import Avg
 
 from product.models   import ProductSize
+from order.models     import market_values
 from .models          import User, ShippingInformation, Portfolio
+from .kakao           import kakao_client, KakaoError
 from my_settings      import ALGORITHM, SECRET_KEY
 from utils            import login_decorator
 
-ORDER_STATUS_HISTORY = 'history'
-
 class PortfolioView(View):
     @login_decorator
     def get(self, request):
         user = request.user
 
-        portfolios = Portfolio.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
-                .filter(user=user).prefetch_related('product_size__ask_set')
+        portfolios = list(Portfolio.objects.select_related('product_size', 'product_size__product', 'product_size__size')\
+                .filter(user_id=user.id))
+
+        product_values = market_values.get_many([portfolio.product_size.product_id for portfolio in portfolios])
 
         portfolio_products = [{
             'name'           : portfolio.product_size.product.name,
             'size'           : portfolio.product_size.size.name,
             'purchase_date'  : portfolio.purchase_date.strftime('%Y/%m/%d'),
             'purchase_price' : int(portfolio.purchase_price),
-            'market_value'   : int(portfolio.product_size.product.productsize_set\
-                    .filter(ask__order_status__name=ORDER_STATUS_HISTORY)\
-                    .annotate(size_avg=Avg('ask__price')).aggregate(total_avg=Avg('size_avg'))['total_avg'])
+            'market_value'   : int(product_values[portfolio.product_size.product_id] or 0)
             } for portfolio in portfolios
         ]
 
@@ -57,7 +55,7 @@ class PortfolioView(View):
         last_day     = calendar.monthrange(int(purchase_year), int(purchase_month))[1]
 
         Portfolio.objects.create(
-            user           = user,
+            user_id        = user.id,
             product_size   = product_size,
             purchase_date  = datetime.strptime(f'{purchase_year}-{purchase_month}-{last_day}', '%Y-%m-%d'),
             purchase_price = purchase_price
@@ -69,24 +67,18 @@ class KakaoSocialLogin(View):
     def post(self, request):
         try:
             access_token = request.headers["Authorization"]
-            headers      = ({'Authorization' : f"Bearer {access_token}"})
-            url          = "https://kapi.kakao.com/v2/user/me"
-            response     = requests.get(url, headers=headers)
-            user         = response.json()
-
-            if User.objects.filter(email = user['kakao_account']['email']).exists(): 
-                user_info     = User.objects.get(email=user['kakao_account']['email'])
-                encoded_jwt   = jwt.encode({'email': user_info.email}, SECRET_KEY, algorithm=ALGORITHM)
-
-                return JsonResponse({'user_name': user_info.name,'access_token' : encoded_jwt}, status = 200)            
-            
-            user_info = User.objects.create(
-                    email = user['kakao_account']['email'],
-                    name  = user['kakao_account']['profile']['nickname']
+            user         = kakao_client.profile(access_token)
+
+            user_info, created = User.objects.get_or_create(
+                email    = user['kakao_account']['email'],
+                defaults = {'name': user['kakao_account']['profile']['nickname']}
             )
-            encode_jwt    = jwt.encode({'email': user_info.email}, SECRET_KEY, algorithm=ALGORITHM)
+            encoded_jwt        = jwt.encode({'id': user_info.id, 'email': user_info.email}, SECRET_KEY, algorithm=ALGORITHM)
+
+            return JsonResponse({'user_name': user_info.name,'access_token' : encoded_jwt}, status = 201 if created else 200)
 
-            return JsonResponse({'user_name' : user_info.name,'access_token' : encode_jwt}, status = 201)            
+        except KakaoError:
+            return JsonResponse({'message': 'KAKAO_UNAVAILABLE'}, status=503)
 
         except KeyError:
             return JsonResponse({'message': 'KEY_ERROR'}, status=400)
@@ -1,30 +1,238 @@
 import jwt
-from json     import JSONDecodeError
+import json
+import time
+import base64
+import weakref
+import threading
+from collections import OrderedDict
+from json        import JSONDecodeError
 
-from django.http import JsonResponse
+from django.conf             import settings
+from django.http             import JsonResponse
+from django.db               import transaction
+from django.db.models        import signals
+from django.utils.functional import SimpleLazyObject
 
 from my_settings import ALGORITHM
 from my_settings import SECRET_KEY
 from user.models import User
 
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+def page_limit(value, default, maximum):
+    limit = int(value) if value else default
+
+    if limit < 1:
+        raise ValueError(value)
+
+    return min(limit, maximum)
+
+class VerifiedTokenCache:
+    def __init__(self, model):
+        self.model   = model
+        self.entries = OrderedDict()
+        self.owners  = {}
+        self.lock    = threading.Lock()
+
+        signals.post_save.connect(self.invalidate, sender=model, weak=False)
+        signals.post_delete.connect(self.invalidate, sender=model, weak=False)
+
+    def maxsize(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+
+    def ttl(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.owners  = {}
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+
+            if not entry:
+                return None
+
+            if entry[0] <= time.monotonic():
+                self.discard(token)
+                return None
+
+            self.entries.move_to_end(token)
+
+            return entry[1]
+
+    def set(self, token, record, expires_at=None):
+        ttl = self.ttl() if expires_at is None else min(self.ttl(), expires_at - time.time())
+
+        if ttl <= 0 or not self.maxsize():
+            return
+
+        with self.lock:
+            self.discard(token)
+            self.entries[token] = (time.monotonic() + ttl, record)
+
+            for owner in [('id', record['id']), ('email', record['email'])]:
+                self.owners.setdefault(owner, set()).add(token)
+
+            while len(self.entries) > self.maxsize():
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, token):
+        entry = self.entries.pop(token, None)
+
+        if not entry:
+            return
+
+        for owner in [('id', entry[1]['id']), ('email', entry[1]['email'])]:
+            tokens = self.owners.get(owner, set())
+            tokens.discard(token)
+
+            if not tokens:
+                self.owners.pop(owner, None)
+
+    def invalidate(self, instance, **kwargs):
+        with self.lock:
+            for owner in [('id', instance.id), ('email', instance.email)]:
+                for token in list(self.owners.get(owner, [])):
+                    self.discard(token)
+
+verified_tokens = VerifiedTokenCache(User)
+
+class LazyUser(SimpleLazyObject):
+    def __init__(self, user_id, func):
+        super().__init__(func)
+        self.__dict__['id'] = self.__dict__['pk'] = user_id
+
+def cache_user(access_token, user, payload):
+    verified_tokens.set(
+        access_token,
+        {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields},
+        payload.get('exp')
+    )
+
+    return user
+
+def authenticate(access_token):
+    record = verified_tokens.get(access_token)
+
+    if record is not None:
+        return User.from_db('default', list(record), list(record.values()))
+
+    payload = jwt.decode(access_token, SECRET_KEY, algorithms=ALGORITHM)
+
+    if 'id' not in payload:
+        return cache_user(access_token, User.objects.get(email=payload['email']), payload)
+
+    return LazyUser(payload['id'], lambda: cache_user(access_token, User.objects.get(id=payload['id']), payload))
+
+def authenticate_request(request):
+    request.user       = None
+    request.auth_error = 'NEED_LOGIN'
+
+    if 'Authorization' not in request.headers:
+        return
+
+    try:
+        request.user       = authenticate(request.headers['Authorization'])
+        request.auth_error = None
+
+    except (jwt.exceptions.InvalidTokenError, KeyError):
+        request.auth_error = 'INVALID_TOKEN'
+
+    except User.DoesNotExist:
+        request.auth_error = 'INVALID_USER'
+
+class TokenAuthenticationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        authenticate_request(request)
+
+        return self.get_response(request)
+
 def login_decorator(func):
     def wrapper(self, request, *args, **kwargs):
-        if 'Authorization' not in request.headers:
-            return JsonResponse({'message':'NEED_LOGIN'}, status=400)
+        if not hasattr(request, 'auth_error'):
+            authenticate_request(request)
 
-        try:
-            access_token = request.headers.get('Authorization', None)
-            payload      = jwt.decode(access_token, SECRET_KEY, algorithms=ALGORITHM)
-            user         = User.objects.get(email=payload['email'])
-            request.user = user
+        if request.auth_error:
+            return JsonResponse({'message': request.auth_error}, status=400)
 
+        try:
             return func(self, request, *args, **kwargs)
-        
-
-        except jwt.exceptions.DecodeError:
-            return JsonResponse({'message': 'INVALID_TOKEN'}, status=400)
 
         except User.DoesNotExist:
             return JsonResponse({'message': 'INVALID_USER'}, status=400)
 
     return wrapper
+
+class ReferenceRegistry:
+    def __init__(self, model, timeout=300):
+        self.model     = model
+        self.timeout   = timeout
+        self.rows      = None
+        self.loaded_at = 0
+
+        signals.post_save.connect(self.invalidate, sender=model, weak=False)
+        signals.post_delete.connect(self.invalidate, sender=model, weak=False)
+
+    def invalidate(self, **kwargs):
+        self.rows = None
+
+    def load(self):
+        rows = self.rows
+
+        if rows is None or time.monotonic() - self.loaded_at > self.timeout:
+            instances = list(self.model.objects.order_by('id'))
+            rows      = {
+                'all'   : instances,
+                'names' : {instance.name: instance for instance in instances},
+                'ids'   : {instance.id: instance for instance in instances},
+            }
+
+            self.rows      = rows
+            self.loaded_at = time.monotonic()
+
+        return rows
+
+    def all(self):
+        return self.load()['all']
+
+    def get(self, name):
+        try:
+            return self.load()['names'][name]
+        except KeyError:
+            raise self.model.DoesNotExist
+
+    def get_by_id(self, instance_id):
+        try:
+            return self.load()['ids'][int(instance_id)]
+        except (KeyError, TypeError, ValueError):
+            raise self.model.DoesNotExist
+
+    def id(self, name):
+        instance = self.load()['names'].get(name)
+        return instance.id if instance else None
+
+class TransactionHook:
+    def __init__(self, func):
+        self.func = func
+
+    def run(self):
+        self.func()
+
+def on_commit_hook(func):
+    hook = TransactionHook(func)
+
+    transaction.on_commit(hook.run)
+
+    # the hook is only kept alive by its on_commit registration, which a commit runs and drops
+    # and a rollback discards, so the reference is live exactly while its transaction is open
+    return weakref.ref(hook)